@@ -0,0 +1,121 @@
+"""
+Measure the cost per line of routing lines received from the printer to the detectors. The old path
+called every detector (paused for user, thermal protection and MMU) for every line. The new path
+is GcodeLineMatcher with the prefixes the detectors register. Input is 600k synthetic lines with
+the mix a printing printer sends (ok, temperature autoreports, busy and wait) plus a few lines that
+match a detector
+
+Usage: python benchmarks/bench_gcode_matcher.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "octoprint_octopod"))
+
+from gcode_line_matcher import GcodeLineMatcher  # noqa: E402
+
+LINES = 600000
+# Prefixes declared by PausedForUser, ThermalProtectionNotifications and MMUAssistance. Detectors
+# import the plugin base class so their prefixes are repeated here
+PAUSED_FOR_USER_PREFIXES = ("echo:busy: paused for user", "// action:paused")
+THERMAL_PROTECTION_PREFIXES = ("echo:Press button to heat nozzle",)
+MMU_PREFIXES = ("mmu_get_response - begin move: T-code", "mmu_get_response() returning: 0")
+
+
+def make_lines(count):
+	random.seed(1)
+	lines = []
+	for _ in range(count):
+		kind = random.random()
+		if kind < 0.55:
+			lines.append("ok")
+		elif kind < 0.85:
+			lines.append("T:%.2f /210.00 B:%.2f /60.00 @:%d B@:%d" % (
+				random.uniform(205, 215), random.uniform(58, 62), random.randint(0, 127), random.randint(0, 127)))
+		elif kind < 0.95:
+			lines.append("echo:busy: processing")
+		elif kind < 0.9999:
+			lines.append("wait")
+		else:
+			lines.append(random.choice(PAUSED_FOR_USER_PREFIXES + THERMAL_PROTECTION_PREFIXES + MMU_PREFIXES))
+	return lines
+
+
+class OldDetectors:
+	""" Same checks that process_received_gcode used to run on every line """
+
+	def __init__(self):
+		self.matches = 0
+		self._mmu_lines_skipped = None
+		self._heater_timeout = False
+
+	def process_received_gcode(self, line):
+		line = self.__paused_for_user(line)
+		self.__thermal_protection(line)
+		return self.__mmu(line)
+
+	def __paused_for_user(self, line):
+		if line.startswith("echo:busy: paused for user") or line.startswith("// action:paused"):
+			self.matches += 1
+		return line
+
+	def __thermal_protection(self, line):
+		if line.startswith("echo:Press button to heat nozzle"):
+			self._heater_timeout = True
+			self.matches += 1
+
+	def __mmu(self, line):
+		if line.startswith("mmu_get_response - begin move: T-code"):
+			self._mmu_lines_skipped = 0
+			self.matches += 1
+		else:
+			if self._mmu_lines_skipped is not None:
+				if self._mmu_lines_skipped > 5:
+					self._mmu_lines_skipped = None
+				elif line.startswith("mmu_get_response() returning: 0"):
+					self.matches += 1
+					self._mmu_lines_skipped = None
+				else:
+					self._mmu_lines_skipped += 1
+		return line
+
+
+def run_old(lines):
+	detectors = OldDetectors()
+	start = time.perf_counter()
+	for line in lines:
+		detectors.process_received_gcode(line)
+	return time.perf_counter() - start, detectors.matches
+
+
+def run_new(lines):
+	matches = [0]
+
+	def handler(line, line_number):
+		matches[0] += 1
+
+	matcher = GcodeLineMatcher()
+	matcher.register(PAUSED_FOR_USER_PREFIXES, handler)
+	matcher.register(THERMAL_PROTECTION_PREFIXES, handler)
+	matcher.register(MMU_PREFIXES, handler)
+
+	start = time.perf_counter()
+	for line in lines:
+		matcher.match(line)
+	return time.perf_counter() - start, matches[0]
+
+
+def main():
+	lines = make_lines(LINES)
+	old_time, old_matches = run_old(lines)
+	new_time, new_calls = run_new(lines)
+	print("lines: %d" % len(lines))
+	print("old detectors:    %6.0f ns/line (%d detections)" % (old_time / len(lines) * 1e9, old_matches))
+	# MMU response lines reach the handler even when no move began. MMUAssistance ignores them
+	print("GcodeLineMatcher: %6.0f ns/line (%d handler calls)" % (new_time / len(lines) * 1e9, new_calls))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,73 @@
+"""
+Compare average luminance of a webcam snapshot computed by snapshot.image_luminance with the
+per-pixel loop it replaced. Input is a synthetic 1640x1232 JPEG (noise over a horizontal gradient)
+encoded at a few brightness levels around the dark image threshold
+
+Usage: python benchmarks/bench_image_luminance.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "octoprint_octopod"))
+
+from snapshot import DARK_IMAGE_THRESHOLD, MAX_SIZE, image_luminance, open_image  # noqa: E402
+
+MEANS = (30, 38, 42, 60)
+REPEAT_OLD = 3
+REPEAT_NEW = 200
+
+
+def make_jpeg(mean, size=MAX_SIZE):
+	noise = Image.effect_noise(size, 20).convert("L")
+	gradient = Image.linear_gradient("L").resize(size)
+	channels = []
+	for weight in (0.9, 1.0, 1.2):
+		band = Image.blend(gradient, noise, 0.5).point(lambda v, w=weight: max(0, min(255, int(mean * w + (v - 128) * 0.3))))
+		channels.append(band)
+	image = Image.merge("RGB", channels)
+	output = BytesIO()
+	image.save(output, "JPEG", quality=85)
+	return output.getvalue()
+
+
+def old_luminance(image):
+	# Implementation replaced by snapshot.image_luminance
+	image_obj = open_image(image)
+	pixels = list(image_obj.getdata())
+	lum_sum = 0
+	for pixel in pixels:
+		r, g, b = pixel
+		lum = (r * 0.299) + (g * 0.587) + (b * 0.114)
+		lum_sum += lum
+	return lum_sum / len(pixels)
+
+
+def measure(function, image, repeat):
+	tracemalloc.start()
+	start = time.perf_counter()
+	for _ in range(repeat):
+		result = function(image)
+	elapsed = (time.perf_counter() - start) / repeat
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return result, elapsed, peak
+
+
+def main():
+	print("%-6s %-22s %-22s %s" % ("mean", "old loop", "image_luminance", "dark (old/new)"))
+	for mean in MEANS:
+		image = make_jpeg(mean)
+		old, old_time, old_peak = measure(old_luminance, image, REPEAT_OLD)
+		new, new_time, new_peak = measure(image_luminance, image, REPEAT_NEW)
+		print("%-6d %6.1f %7.3f s %5.1f MB %6.1f %7.3f ms %4.2f MB   %s/%s" % (
+			mean, old, old_time, old_peak / 1e6, new, new_time * 1000, new_peak / 1e6,
+			old < DARK_IMAGE_THRESHOLD, new < DARK_IMAGE_THRESHOLD))
+
+
+if __name__ == "__main__":
+	main()
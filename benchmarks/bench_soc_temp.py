@@ -0,0 +1,92 @@
+"""
+Compare the cost of a SoC temperature check read from a thermal zone (ThermalZone) with the
+commands it replaced: vcgencmd on a Raspberry Pi and cat on Armbian. A fake sysfs tree with two
+thermal zones and a fake vcgencmd script are created in a temporary folder. Commands are run with
+sarge when installed (like the plugin does) or with subprocess.run, which sarge wraps
+
+Usage: python benchmarks/bench_soc_temp.py
+"""
+import logging
+import os
+import re
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "octoprint_octopod", "libs"))
+
+from sbc import SBCFactory, ThermalZone  # noqa: E402
+
+THERMAL_ZONE_CHECKS = 100000
+PROCESS_CHECKS = 500
+
+try:
+	import sarge
+except ImportError:
+	sarge = None
+
+
+def make_fake_tree(root):
+	# Zone 0 is a GPU zone so the factory has to pick the CPU zone
+	for number, zone_type, millidegrees in ((0, "gpu-thermal", 41000), (1, "cpu-thermal", 48312)):
+		zone = os.path.join(root, "thermal", "thermal_zone%d" % number)
+		os.makedirs(zone)
+		with open(os.path.join(zone, "type"), "w") as outfile:
+			outfile.write(zone_type + "\n")
+		with open(os.path.join(zone, "temp"), "w") as outfile:
+			outfile.write("%d\n" % millidegrees)
+	vcgencmd = os.path.join(root, "vcgencmd")
+	with open(vcgencmd, "w") as outfile:
+		outfile.write("#!/bin/sh\necho \"temp=48.3'C\"\n")
+	os.chmod(vcgencmd, os.stat(vcgencmd).st_mode | stat.S_IEXEC)
+	soctemp = os.path.join(root, "soctemp")
+	with open(soctemp, "w") as outfile:
+		outfile.write("48312\n")
+	return vcgencmd, soctemp
+
+
+def run_command(command, pattern):
+	# Same work as SBC.check_soc_temp: spawn the command and parse its output
+	if sarge is not None:
+		output = sarge.run(command, stdout=sarge.Capture()).stdout.text
+	else:
+		output = subprocess.run(command, shell=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+	return re.search(pattern, output).group(1)
+
+
+def measure(function, repeat):
+	start = time.perf_counter()
+	for _ in range(repeat):
+		result = function()
+	return result, (time.perf_counter() - start) / repeat
+
+
+def main():
+	logger = logging.getLogger("bench_soc_temp")
+	root = tempfile.mkdtemp()
+	try:
+		vcgencmd, soctemp = make_fake_tree(root)
+		factory = SBCFactory()
+		factory.thermalZonesPath = os.path.join(root, "thermal")
+		zone = ThermalZone(logger, factory._find_thermal_zone())
+
+		results = [
+			("ThermalZone pread", measure(zone.check_soc_temp, THERMAL_ZONE_CHECKS)),
+			("fake vcgencmd (process)", measure(lambda: run_command(vcgencmd + " measure_temp", "=(.*)'"),
+												PROCESS_CHECKS)),
+			("cat (process)", measure(lambda: run_command("cat " + soctemp, r"(\d+)"), PROCESS_CHECKS)),
+		]
+		zone.close()
+	finally:
+		shutil.rmtree(root)
+
+	print("commands run with %s" % ("sarge" if sarge is not None else "subprocess.run"))
+	for name, (temp, elapsed) in results:
+		print("%-25s %10.2f us/check (%s)" % (name, elapsed * 1e6, temp))
+
+
+if __name__ == "__main__":
+	main()
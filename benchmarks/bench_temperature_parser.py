@@ -0,0 +1,84 @@
+"""
+Compare parse_temperature_line with a regular expression like the one OctoPrint uses to parse
+temperature reports. Input is a synthetic log of 10k autoreport (M155) and M105 lines of a printer
+with two extruders
+
+Usage: python benchmarks/bench_temperature_parser.py
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "octoprint_octopod"))
+
+from temperature_parser import parse_temperature_line  # noqa: E402
+
+LINES = 10000
+REPEAT = 20
+TEMPERATURE_REGEX = re.compile(
+	r"(?P<tool>B|C|T(?P<toolnum>\d*)):\s*(?P<actual>[-+]?\d*\.?\d+)(\s*\/?\s*(?P<target>[-+]?\d*\.?\d+))?")
+
+
+def make_lines(count):
+	random.seed(1)
+	lines = []
+	for i in range(count):
+		if i % 2 == 0:
+			lines.append("T:%.2f /210.00 B:%.2f /60.00 @:%d B@:%d" % (
+				random.uniform(205, 215), random.uniform(58, 62), random.randint(0, 127), random.randint(0, 127)))
+		else:
+			tool = random.uniform(205, 215)
+			lines.append("ok T:%.2f /210.00 B:%.2f /60.00 T0:%.2f /210.00 T1:25.00 /0.00 @:0 B@:0" % (
+				tool, random.uniform(58, 62), tool))
+	return lines
+
+
+def parse_with_regex(line):
+	temps = None
+	current_tool = None
+	for match in TEMPERATURE_REGEX.finditer(line):
+		values = match.groupdict()
+		if values["target"] is None:
+			continue
+		temperature = {'actual': float(values["actual"]), 'target': float(values["target"])}
+		tool = values["tool"]
+		if tool == 'T':
+			current_tool = temperature
+			continue
+		if temps is None:
+			temps = {}
+		if tool == 'B':
+			temps['bed'] = temperature
+		elif tool == 'C':
+			temps['chamber'] = temperature
+		else:
+			temps['tool' + values["toolnum"]] = temperature
+	if current_tool is not None and (temps is None or 'tool0' not in temps):
+		if temps is None:
+			temps = {}
+		temps['tool0'] = current_tool
+	return temps
+
+
+def measure(function, lines):
+	start = time.perf_counter()
+	for _ in range(REPEAT):
+		for line in lines:
+			function(line)
+	return (time.perf_counter() - start) / (REPEAT * len(lines))
+
+
+def main():
+	lines = make_lines(LINES)
+	mismatches = sum(1 for line in lines if parse_temperature_line(line) != parse_with_regex(line))
+	regex_time = measure(parse_with_regex, lines)
+	parser_time = measure(parse_temperature_line, lines)
+	print("lines: %d (results that differ: %d)" % (len(lines), mismatches))
+	print("regex:                  %6.2f us/line" % (regex_time * 1e6))
+	print("parse_temperature_line: %6.2f us/line" % (parser_time * 1e6))
+
+
+if __name__ == "__main__":
+	main()
@@ -1,30 +1,39 @@
 # coding=utf-8
 from __future__ import absolute_import
 
-import datetime
 import logging
+import os
 import sys
 
 import flask
-import requests
 
 import octoprint.plugin
 from octoprint.access.permissions import Permissions
 from octoprint.events import eventManager, Events
 from octoprint.util import RepeatedTimer
 from .spool_manager import SpoolManagerNotifications
+from . import http_session, temperature_parser
+from .alerts import Alerts
 from .bed_notifications import BedNotifications
 from .custom_notifications import CustomNotifications
+from .gcode_line_matcher import GcodeLineMatcher
 from .ifttt_notifications import IFTTTAlerts
 from .job_notifications import JobNotifications
 from .layer_notifications import LayerNotifications
 from .libs.sbc import SBCFactory, RPi
 from .live_activities import LiveActivities
 from .mmu import MMUAssistance
+from .notification_dispatcher import NotificationDispatcher
+from .outbox import Outbox
 from .palette2 import Palette2Notifications
 from .paused_for_user import PausedForUser
+from .rate_limiter import rate_limiter
+from .settings_snapshot import SettingsSnapshot
 from .soc_temp_notifications import SocTempNotifications
+from .temperature_pipeline import TemperatureCallback, TemperaturePipeline
+from .thermal_profiles import ThermalProfiles
 from .thermal_protection_notifications import ThermalProtectionNotifications
+from .token_registry import TokenRegistry
 from .tools_notifications import ToolsNotifications
 
 # Plugin that stores APNS tokens reported from iOS devices to know which iOS devices to alert
@@ -37,6 +46,7 @@ class OctopodPlugin(octoprint.plugin.SettingsPlugin,
 					octoprint.plugin.AssetPlugin,
 					octoprint.plugin.TemplatePlugin,
 					octoprint.plugin.StartupPlugin,
+					octoprint.plugin.ShutdownPlugin,
 					octoprint.plugin.SimpleApiPlugin,
 					octoprint.plugin.EventHandlerPlugin,
 					octoprint.plugin.ProgressPlugin):
@@ -45,7 +55,12 @@ class OctopodPlugin(octoprint.plugin.SettingsPlugin,
 		super(OctopodPlugin, self).__init__()
 		self._logger = logging.getLogger("octoprint.plugins.octopod")
 		self._checkTempTimer = None
-		self._ifttt_alerts = IFTTTAlerts(self._logger)
+		self._dispatcher = NotificationDispatcher(self._logger)
+		# Notifications that failed to be sent are retried later
+		self._outbox = Outbox(self._logger)
+		self._ifttt_alerts = IFTTTAlerts(self._logger, self._dispatcher, self._outbox, lambda: self._settings_snapshot)
+		# All notifications share the same Alerts (and HTTP connections) to the OctoPod server
+		self._alerts = Alerts(self._logger, self._outbox)
 		self._check_soc_temp_timer = None
 		self._soc_timer_interval = 5.0 if debug_soc_temp else 30.0
 		self._job_notifications = None
@@ -60,6 +75,14 @@ class OctopodPlugin(octoprint.plugin.SettingsPlugin,
 		self._thermal_protection_notifications = None
 		self._live_activities = None
 		self._spool_manager = None
+		self._received_gcode_matcher = GcodeLineMatcher()
+		self._temperature_pipeline = TemperaturePipeline(self._logger)
+		self._temperature_callback = None
+		# Heating and cooling rates learned for each heater
+		self._thermal_profiles = ThermalProfiles(self._logger)
+		# Immutable copy of settings used by notifications. Replaced (never modified) when settings are saved
+		self._settings_snapshot = None
+		self._token_registry = TokenRegistry(self._logger, self._save_tokens)
 
 	# StartupPlugin mixin
 
@@ -71,25 +94,62 @@ class OctopodPlugin(octoprint.plugin.SettingsPlugin,
 		else:
 			self._logger.setLevel(logging.INFO)
 
-		self._job_notifications = JobNotifications(self._logger, self._ifttt_alerts, self._plugin_manager)
-		self._tool_notifications = ToolsNotifications(self._logger, self._ifttt_alerts, self._plugin_manager)
-		self._bed_notifications = BedNotifications(self._logger, self._ifttt_alerts, self._plugin_manager)
-		self._mmu_assitance = MMUAssistance(self._logger, self._ifttt_alerts, self._plugin_manager)
-		self._paused_for_user = PausedForUser(self._logger, self._ifttt_alerts, self._plugin_manager)
-		self._palette2 = Palette2Notifications(self._logger, self._ifttt_alerts, self._plugin_manager)
-		self._layerNotifications = LayerNotifications(self._logger, self._ifttt_alerts, self._plugin_manager)
+		self._token_registry.load(self._settings.get(["tokens"]))
+		self._update_settings_snapshot()
+		self._configure_http_session()
+
+		# Send notifications that were pending when OctoPrint was stopped
+		self._outbox.load(os.path.join(self.get_plugin_data_folder(), "outbox.jsonl"))
+		self._thermal_profiles.load(os.path.join(self.get_plugin_data_folder(), "thermal_profiles.json"))
+
+		self._job_notifications = JobNotifications(self._logger, self._ifttt_alerts, self._plugin_manager,
+												   self._dispatcher, self._alerts)
+		self._tool_notifications = ToolsNotifications(self._logger, self._ifttt_alerts, self._plugin_manager,
+													  self._dispatcher, self._alerts)
+		self._bed_notifications = BedNotifications(self._logger, self._ifttt_alerts, self._plugin_manager,
+												   self._dispatcher, self._alerts)
+		self._mmu_assitance = MMUAssistance(self._logger, self._ifttt_alerts, self._plugin_manager, self._dispatcher,
+											self._alerts)
+		self._paused_for_user = PausedForUser(self._logger, self._ifttt_alerts, self._plugin_manager, self._dispatcher,
+											  self._alerts)
+		self._palette2 = Palette2Notifications(self._logger, self._ifttt_alerts, self._plugin_manager,
+											   self._dispatcher, self._alerts)
+		self._layerNotifications = LayerNotifications(self._logger, self._ifttt_alerts, self._plugin_manager,
+													  self._dispatcher, self._alerts)
 		self._soc_temp_notifications = SocTempNotifications(self._logger, self._ifttt_alerts, self._plugin_manager,
-															self._soc_timer_interval, debug_soc_temp)
-		self._custom_notifications = CustomNotifications(self._logger, self._plugin_manager)
+															self._dispatcher, self._alerts, self._soc_timer_interval,
+															debug_soc_temp)
+		self._custom_notifications = CustomNotifications(self._logger, self._plugin_manager, self._dispatcher,
+														 self._alerts)
 		self._thermal_protection_notifications = ThermalProtectionNotifications(self._logger, self._ifttt_alerts,
-																				self._plugin_manager)
-		self._live_activities = LiveActivities(self._logger, self._plugin_manager)
-		self._spool_manager = SpoolManagerNotifications(self._logger, self._ifttt_alerts, self._plugin_manager)
+																				self._plugin_manager,
+																				self._dispatcher, self._alerts,
+																				self._thermal_profiles)
+		self._live_activities = LiveActivities(self._logger, self._plugin_manager, self._dispatcher, self._alerts)
+		self._spool_manager = SpoolManagerNotifications(self._logger, self._ifttt_alerts, self._plugin_manager,
+														self._dispatcher, self._alerts)
+
+		# Register detectors of lines received from the printer
+		self._received_gcode_matcher.register(PausedForUser.RECEIVED_GCODE_PREFIXES,
+											  self._on_paused_for_user_line)
+		self._received_gcode_matcher.register(ThermalProtectionNotifications.RECEIVED_GCODE_PREFIXES,
+											  self._on_thermal_protection_line)
+		self._received_gcode_matcher.register(MMUAssistance.RECEIVED_GCODE_PREFIXES, self._on_mmu_line)
+		self._received_gcode_matcher.register(temperature_parser.RECEIVED_GCODE_PREFIXES, self._on_temperature_line)
+
+		# Register detectors of printer temperatures
+		self._temperature_pipeline.register(self._bed_notifications)
+		self._temperature_pipeline.register(self._tool_notifications)
+		self._temperature_pipeline.register(self._thermal_protection_notifications)
+		# Process temperatures as soon as they are reported by the printer
+		self._temperature_callback = TemperatureCallback(self._temperature_pipeline, lambda: self._settings_snapshot,
+														 self._printer)
+		self._printer.register_callback(self._temperature_callback)
 
 		# Register to listen for messages from other plugins
 		self._plugin_manager.register_message_receiver(self.on_plugin_message)
 
-		# Start timer that will check bed temperature and send notifications if needed
+		# Start fallback timer that will check temperatures when printer is not reporting them
 		self._restart_timer()
 
 		# if running on linux then check soc temperature
@@ -101,6 +161,17 @@ class OctopodPlugin(octoprint.plugin.SettingsPlugin,
 				self._soc_temp_notifications.send_plugin_message = self.send_plugin_message
 				self.start_soc_timer(self._soc_timer_interval)
 
+	# ShutdownPlugin mixin
+
+	def on_shutdown(self):
+		if self._temperature_callback:
+			self._printer.unregister_callback(self._temperature_callback)
+		# Save tokens that were registered while waiting to save them
+		self._token_registry.flush()
+		self._thermal_profiles.flush()
+		self._outbox.shutdown()
+		self._dispatcher.shutdown()
+
 	# SettingsPlugin mixin
 
 	def get_settings_defaults(self):
@@ -113,6 +184,8 @@ class OctopodPlugin(octoprint.plugin.SettingsPlugin,
 			temp_interval=5,
 			tool0_low=0,
 			tool0_target_temp=False,
+			chamber_low=0,
+			chamber_target_temp=False,
 			bed_low=30,
 			bed_target_temp_hold=10,
 			bed_warm_notify_once=False,
@@ -136,13 +209,23 @@ class OctopodPlugin(octoprint.plugin.SettingsPlugin,
 			notify_first_X_layers=1, # Deprecated and replaced by notify_layers that has better control
 			notify_layers=[2],
 			print_complete_delay_seconds=0,
-			turn_HA_light_on_ifneeded = True
+			turn_HA_light_on_ifneeded = True,
+			batch_notifications=True,  # Send one request for all devices with the same language and printer name
+			snapshot_cache_seconds=2,  # Reuse webcam snapshot for notifications fired within these seconds
+			connect_timeout=4,  # Seconds to wait for a connection to OctoPod server, IFTTT or webcam
+			read_timeout=10  # Seconds to wait for a response from OctoPod server, IFTTT or webcam
 		)
 
 	def on_settings_save(self, data):
 		old_debug_logging = self._settings.get_boolean(["debug_logging"])
 
+		# Save pending token changes first so that they are not lost when settings are saved
+		self._token_registry.flush()
 		octoprint.plugin.SettingsPlugin.on_settings_save(self, data)
+		# Tokens may have been removed by the user
+		self._token_registry.load(self._settings.get(["tokens"]))
+		self._update_settings_snapshot()
+		self._configure_http_session()
 
 		new_debug_logging = self._settings.get_boolean(["debug_logging"])
 		if old_debug_logging != new_debug_logging:
@@ -151,6 +234,14 @@ class OctopodPlugin(octoprint.plugin.SettingsPlugin,
 			else:
 				self._logger.setLevel(logging.INFO)
 
+	def _update_settings_snapshot(self):
+		# Build the whole snapshot before replacing the reference so readers see old or new settings but never a mix
+		self._settings_snapshot = SettingsSnapshot(self._settings, self.get_settings_defaults().keys(),
+												   self._token_registry.unique_tokens())
+
+	def _configure_http_session(self):
+		http_session.configure(self._settings.get_int(["connect_timeout"]), self._settings.get_int(["read_timeout"]))
+
 	def get_settings_version(self):
 		return 15
 
@@ -233,18 +324,18 @@ class OctopodPlugin(octoprint.plugin.SettingsPlugin,
 	# progress-hook
 	def on_print_progress(self, storage, path, progress):
 		# progress 0 - 100
-		self._job_notifications.on_print_progress(self._settings, progress, self._printer)
-		self._live_activities.on_print_progress(self._settings, self._printer)
+		self._job_notifications.on_print_progress(self._settings_snapshot, progress, self._printer)
+		self._live_activities.on_print_progress(self._settings_snapshot, self._printer)
 
 	# EventHandlerPlugin mixin
 
 	def on_event(self, event, payload):
 		if event == Events.PRINTER_STATE_CHANGED:
-			self._job_notifications.send_print_job_notification(self._settings, self._printer, payload)
-			self._live_activities.on_printer_state_changed(self._settings, self._printer, payload)
+			self._job_notifications.send_print_job_notification(self._settings_snapshot, self._printer, payload)
+			self._live_activities.on_printer_state_changed(self._settings_snapshot, self._printer, payload)
 		elif event == "DisplayLayerProgress_layerChanged":
 			# Event sent from DisplayLayerProgress plugin when there was a detected layer changed
-			self._layerNotifications.layer_changed(self._settings, payload["currentLayer"])
+			self._layerNotifications.layer_changed(self._settings_snapshot, payload["currentLayer"])
 		elif event == Events.PRINT_STARTED or event == Events.PRINT_DONE or event == Events.PRINT_CANCELLED \
 				or event == Events.PRINT_FAILED:
 			# Reset layers for which we need to send a notification. Each new print job has its own
@@ -254,55 +345,15 @@ class OctopodPlugin(octoprint.plugin.SettingsPlugin,
 
 	def update_token(self, old_token, new_token, device_name, printer_id, printer_name, language_code):
 		self._logger.debug("Received tokens for %s." % device_name)
+		if self._token_registry.update(old_token, new_token, device_name, printer_id, printer_name, language_code):
+			# Notifications use new token right away. Settings are saved once devices stop registering
+			self._update_settings_snapshot()
 
-		existing_tokens = self._settings.get(["tokens"])
-
-		# Safety check in case a user manually modified config.yaml and left invalid JSON
-		if existing_tokens is None:
-			existing_tokens = []
-
-		found = False
-		updated = False
-		for token in existing_tokens:
-			# Check if existing token has been updated
-			if token["apnsToken"] == old_token and token["printerID"] == printer_id:
-				if old_token != new_token:
-					self._logger.debug("Updating token for %s." % device_name)
-					# Token that exists needs to be updated with new token
-					token["apnsToken"] = new_token
-					token["date"] = datetime.datetime.now().strftime("%x %X")
-					updated = True
-				found = True
-			elif token["apnsToken"] == new_token and token["printerID"] == printer_id:
-				found = True
-
-			if found:
-				if printer_name is not None and ("printerName" not in token or token["printerName"] != printer_name):
-					# Printer name in OctoPod has been updated
-					token["printerName"] = printer_name
-					token["date"] = datetime.datetime.now().strftime("%x %X")
-					updated = True
-				if language_code is not None and (
-						"languageCode" not in token or token["languageCode"] != language_code):
-					# Language being used by OctoPod has been updated
-					token["languageCode"] = language_code
-					token["date"] = datetime.datetime.now().strftime("%x %X")
-					updated = True
-				break
-
-		if not found:
-			self._logger.debug("Adding token for %s." % device_name)
-			# Token was not found so we need to add it
-			existing_tokens.append(
-				{'apnsToken': new_token, 'deviceName': device_name, 'date': datetime.datetime.now().strftime("%x %X"),
-				 'printerID': printer_id, 'printerName': printer_name, 'languageCode': language_code})
-			updated = True
-		if updated:
-			# Save new settings
-			self._settings.set(["tokens"], existing_tokens)
-			self._settings.save()
-			eventManager().fire(Events.SETTINGS_UPDATED)
-			self._logger.debug("Tokens saved")
+	def _save_tokens(self, tokens):
+		# Save new settings
+		self._settings.set(["tokens"], tokens)
+		self._settings.save()
+		eventManager().fire(Events.SETTINGS_UPDATED)
 
 	def get_api_commands(self):
 		return dict(updateToken=["oldToken", "newToken", "deviceName", "printerID"], test=[], octoPodStatus=[],
@@ -334,26 +385,30 @@ class OctopodPlugin(octoprint.plugin.SettingsPlugin,
 				state_id="OPERATIONAL",
 				state_string="Operational"
 			)
-			code = self._job_notifications.send_print_job_notification(self._settings, self._printer, payload,
-																	   data["server_url"], data["camera_snapshot_url"],
-																	   data["camera_flip_h"], data["camera_flip_v"],
-																	   data["camera_rotate90"],
+			code = self._job_notifications.send_print_job_notification(self._settings_snapshot, self._printer,
+																	   payload, data["server_url"],
+																	   data["camera_snapshot_url"], data["camera_flip_h"],
+																	   data["camera_flip_v"], data["camera_rotate90"],
 																	   True)
 			return flask.jsonify(dict(code=code))
 		elif command == 'octoPodStatus':
 			# Make HTTP request to OctoPod server to check if it's up and running
 			try:
 				endpoint = data["server_url"] + "/v1/octopod/status"
-				response = requests.get(endpoint, timeout=1)
-				return flask.jsonify(dict(code=response.status_code))
+				response = http_session.get(endpoint, timeout=1)
+				return flask.jsonify(dict(code=response.status_code, dispatcher=self._dispatcher.get_stats(),
+										  outbox=self._outbox.get_stats(),
+										  circuit_breakers=http_session.get_circuit_breakers_state()))
 			except Exception as e:
 				self._logger.error("Error checking OctoPod status: %s" % str(e))
-				return flask.jsonify(dict(code=-1))
+				return flask.jsonify(dict(code=-1, dispatcher=self._dispatcher.get_stats(),
+										  outbox=self._outbox.get_stats(),
+										  circuit_breakers=http_session.get_circuit_breakers_state()))
 		elif command == 'snooze':
-			if data["eventCode"] == 'mmu-event':
-				self._mmu_assitance.snooze(data["minutes"])
-			else:
+			if not data["eventCode"]:
 				return flask.make_response("Snooze for unknown event", 400)
+			rate_limiter.snooze(data["eventCode"], data["minutes"])
+			self._logger.debug("Snoozing {0} notifications for {1} minutes".format(data["eventCode"], data["minutes"]))
 		elif command == 'addLayer':
 			self._layerNotifications.add_layer(data["layer"])
 		elif command == 'removeLayer':
@@ -361,7 +416,9 @@ class OctopodPlugin(octoprint.plugin.SettingsPlugin,
 		elif command == 'getLayers':
 			return flask.jsonify(dict(layers=self._layerNotifications.get_layers()))
 		elif command == 'getSoCTemps':
-			return flask.jsonify(self._soc_temp_notifications.get_soc_temps())
+			since = int(data["since"]) if "since" in data else None
+			step = int(data["step"]) if "step" in data else None
+			return flask.jsonify(self._soc_temp_notifications.get_soc_temps(since, step))
 		else:
 			return flask.make_response("Unknown command", 400)
 
@@ -397,8 +454,8 @@ class OctopodPlugin(octoprint.plugin.SettingsPlugin,
 	# Plugin messages
 
 	def on_plugin_message(self, plugin, data, permissions=None):
-		self._palette2.check_plugin_message(self._settings, self._printer, plugin, data)
-		self._spool_manager.check_plugin_message(self._settings, self._printer, plugin, data)
+		self._palette2.check_plugin_message(self._settings_snapshot, self._printer, plugin, data)
+		self._spool_manager.check_plugin_message(self._settings_snapshot, self._printer, plugin, data)
 
 	def send_plugin_message(self, data):
 		self._plugin_manager.send_plugin_message(self._identifier, data)
@@ -420,9 +477,9 @@ class OctopodPlugin(octoprint.plugin.SettingsPlugin,
 			self._checkTempTimer.start()
 
 	def run_timer_job(self):
-		self._bed_notifications.check_temps(self._settings, self._printer)
-		self._tool_notifications.check_temps(self._settings, self._printer)
-		self._thermal_protection_notifications.check_temps(self._settings, self._printer)
+		# Poll temperatures only if printer did not report them since last run
+		settings = self._settings_snapshot
+		self._temperature_pipeline.tick(settings, self._printer, settings.temp_interval)
 
 	def start_soc_timer(self, interval):
 		self._logger.debug(u"Monitoring SoC temp with Timer")
@@ -430,17 +487,31 @@ class OctopodPlugin(octoprint.plugin.SettingsPlugin,
 		self._check_soc_temp_timer.start()
 
 	def update_soc_temp(self):
-		self._soc_temp_notifications.check_soc_temp(self._settings)
+		self._soc_temp_notifications.check_soc_temp(self._settings_snapshot)
 
 	# GCODE hook
 
 	def process_sent_gcode(self, comm_instance, phase, cmd, cmd_type, gcode, *args, **kwargs):
-		self._paused_for_user.process_sent_gcode(self._settings, self._printer, gcode)
+		self._paused_for_user.process_sent_gcode(self._settings_snapshot, self._printer, gcode)
 
 	def process_received_gcode(self, comm, line, *args, **kwargs):
-		line = self._paused_for_user.process_received_gcode(self._settings, self._printer, line)
+		# Called for every line received from the printer. Detectors are only called for lines they care about
+		self._received_gcode_matcher.match(line)
+		return line
+
+	def _on_paused_for_user_line(self, line, line_number):
+		self._paused_for_user.process_received_gcode(self._settings_snapshot, self._printer, line)
+
+	def _on_thermal_protection_line(self, line, line_number):
 		self._thermal_protection_notifications.process_received_gcode(line)
-		return self._mmu_assitance.process_received_gcode(self._settings, line)
+
+	def _on_mmu_line(self, line, line_number):
+		self._mmu_assitance.process_received_gcode(self._settings_snapshot, line, line_number)
+
+	def _on_temperature_line(self, line, line_number):
+		temps = temperature_parser.parse_temperature_line(line)
+		if temps:
+			self._temperature_pipeline.process_parsed(self._settings_snapshot, self._printer, temps)
 
 	# Helper functions
 
@@ -453,7 +524,7 @@ class OctopodPlugin(octoprint.plugin.SettingsPlugin,
 		:param image: Optional. (PIL Image) Image to include in the notification
 		:return: True if the notification was successfully sent
 		"""
-		return self._custom_notifications.send_notification(self._settings, message, image)
+		return self._custom_notifications.send_notification(self._settings_snapshot, message, image)
 
 
 # If you want your plugin to be registered within OctoPrint under a different name than what you defined in setup.py
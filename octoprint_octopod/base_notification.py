@@ -1,43 +1,47 @@
-from io import BytesIO  ## for Python 2 & 3
-
-import requests
+from collections import OrderedDict
 import time
-from PIL import Image
 
-from .alerts import Alerts
+from . import http_session
+from .prepared_image import PreparedImage
+from .rate_limiter import rate_limiter
+from .snapshot import DARK_IMAGE_THRESHOLD, image_luminance, snapshot_cache, transform_image
 
 
 class BaseNotification:
 	_plugin_manager = None
 
-	def __init__(self, logger, plugin_manager):
+	def __init__(self, logger, plugin_manager, dispatcher, alerts):
 		self._logger = logger
-		self._alerts = Alerts(self._logger)
+		self._alerts = alerts
 		self._plugin_manager = plugin_manager
+		self._dispatcher = dispatcher
 
-	def image(self, turn_on_ifneeded, snapshot_url, hflip, vflip, rotate):
+	def image(self, turn_on_ifneeded, snapshot_url, hflip, vflip, rotate, cache_seconds=0):
 		"""
 		Create an image by getting an image form the setting webcam-snapshot.
-		Transpose this image according the settings and returns it
+		Transpose this image according the settings and returns it. Concurrent requests for
+		the same image wait for a single snapshot and the image is reused for cache_seconds
 		:return:
 		"""
+		key = (snapshot_url, bool(hflip), bool(vflip), bool(rotate), bool(turn_on_ifneeded))
+		return snapshot_cache.get(key, cache_seconds,
+								  lambda: self.__create_image(turn_on_ifneeded, snapshot_url, hflip, vflip, rotate))
+
+	def __create_image(self, turn_on_ifneeded, snapshot_url, hflip, vflip, rotate):
 		self._logger.debug("Snapshot URL: %s " % str(snapshot_url))
 		image = self.__take_image_snapshot(snapshot_url)
 
 		try:
-			image_obj = Image.open(BytesIO(image))
-
 			# if octolight HA plugin is installed then check if room is dark and turn on the light if needed
 			octolightHA = self._plugin_manager.plugins.get("octolightHA")
 			if octolightHA is not None and octolightHA.enabled and turn_on_ifneeded:
-				if self.__is_image_dark(image_obj):
+				if self.__is_image_dark(image):
 					# Some webcams need a sec to adapt to lighting conditions. They initially see black. Wait a sec
 					time.sleep(1)
 					# Fetch another snapshot
 					image = self.__take_image_snapshot(snapshot_url)
-					image_obj = Image.open(BytesIO(image))
 					# Check again if still dark
-					if self.__is_image_dark(image_obj):
+					if self.__is_image_dark(image):
 						self._logger.debug("Toggling HA light")
 						# Turn on the light
 						octolightHA.implementation.toggle_HA_state()
@@ -45,73 +49,58 @@ class BaseNotification:
 						time.sleep(1)
 						# Fetch image again
 						image = self.__take_image_snapshot(snapshot_url)
-						image_obj = Image.open(BytesIO(image))
 						# Turn on the light
 						octolightHA.implementation.toggle_HA_state()
 
-			# Reduce resolution of image to prevent 400 error when uploading content
-			# Besides this saves network bandwidth and iOS device or Apple Watch
-			# cannot tell the difference in resolution
-			x, y = image_obj.size
-			if x > 1640 or y > 1232:
-				size = 1640, 1232
-				# ANTIALIAS was removed in Pillow 10.0.0 so check which variation we can use
-				image_obj.thumbnail(size, Image.ANTIALIAS if hasattr(Image, "ANTIALIAS") else Image.Resampling.LANCZOS)
-				# image_obj.thumbnail(size, Image.ANTIALIAS)
-				output = BytesIO()
-				image_obj.save(output, format="JPEG")
-				image = output.getvalue()
-				output.close()
+			# Reduce resolution and transpose image with a single decode and encode of the image
+			image = transform_image(image, hflip, vflip, rotate)
 		except Exception as e:
-			self._logger.debug("Error reducing resolution of image: %s" % str(e))
-
-		if hflip or vflip or rotate:
-			try:
-				# https://www.blog.pythonlibrary.org/2017/10/05/how-to-rotate-mirror-photos-with-python/
-				image_obj = Image.open(BytesIO(image))
-				if hflip:
-					image_obj = image_obj.transpose(Image.FLIP_LEFT_RIGHT)
-				if vflip:
-					image_obj = image_obj.transpose(Image.FLIP_TOP_BOTTOM)
-				if rotate:
-					image_obj = image_obj.rotate(90)
-
-				# https://stackoverflow.com/questions/646286/python-pil-how-to-write-png-image-to-string/5504072
-				output = BytesIO()
-				image_obj.save(output, format="JPEG")
-				image = output.getvalue()
-				output.close()
-			except Exception as e:
-				self._logger.debug("Error rotating image: %s" % str(e))
+			self._logger.debug("Error transforming image: %s" % str(e))
 
 		return image
 
 	def __take_image_snapshot(self, snapshot_url):
-		return requests.get(snapshot_url, stream=True, timeout=(4, 10)).content
+		return http_session.get(snapshot_url).content
 
-	def __is_image_dark(self, image_obj):
+	def __is_image_dark(self, image):
 		# Check image luminance to detect if it's dark and we need to
 		# turn on the Home Assistant Light (if plugin is installed)
-		# Get the pixel values as a numpy array
-		pixels = list(image_obj.getdata())
-
-		# Calculate the total luminance of all pixels
-		lum_sum = 0
-		for pixel in pixels:
-			r, g, b = pixel
-			# Use perceived luminance formula
-			lum = (r * 0.299) + (g * 0.587) + (b * 0.114)
-			lum_sum += lum
-
-		# Get the average luminance
-		avg_lum = lum_sum / len(pixels)
-		# Luminance below threshold is considered a dark image. Use same value used in iOS app
-		threshold = 40
-		if avg_lum < threshold:
+		avg_lum = image_luminance(image)
+		if avg_lum < DARK_IMAGE_THRESHOLD:
 			self._logger.debug("Camera image seems to have low light. Luminance: %s" % str(avg_lum))
 			return True
 		return False
 
+	def _dispatch(self, code_block, *args, **kwargs):
+		"""
+		Execute code in a notification worker thread. Detectors may be called from the serial
+		communication thread so they should never wait for camera snapshots or HTTP requests.
+		Notifications of this notifier are sent in the order they were dispatched
+
+		:param code_block: Code to execute (e.g. #_send_base_notification)
+		:return: True if code was queued for execution
+		"""
+		return self._dispatcher.submit_from(self, False, code_block, *args, **kwargs)
+
+	def _dispatch_update(self, code_block, *args, **kwargs):
+		"""
+		Same as #_dispatch for notifications that a newer one replaces (e.g. print progress). These
+		are dropped first if too many notifications are waiting to be sent
+
+		:param code_block: Code to execute (e.g. #_send_base_notification)
+		:return: True if code was queued for execution or False if it was dropped
+		"""
+		return self._dispatcher.submit_from(self, True, code_block, *args, **kwargs)
+
+	def _fan_out(self, calls):
+		"""
+		Execute the requests of this notification (e.g. one per device) concurrently and wait for them
+
+		:param calls: list of (function, args) to execute
+		:return: list with the result of each call in the same order as calls
+		"""
+		return self._dispatcher.fan_out(calls)
+
 	def _send_base_notification(self, settings, include_image, event_code, category=None, event_param=None,
 								apns_dict=None, silent_code_block=None, legacy_code_block=None):
 		"""
@@ -131,12 +120,17 @@ class BaseNotification:
 		:return: Negative value if failed to send notification or otherwise HTTP status code returned
 		by OctoPod APNS service (see url param)
 		"""
+		if rate_limiter.is_snoozed(event_code):
+			# User asked to not receive notifications of this type for some time
+			self._logger.debug("Notification %s skipped. Snoozing" % event_code)
+			return -3
+
 		server_url = self._get_server_url(settings)
 		if not server_url or not server_url.strip():
 			# No APNS server has been defined so do nothing
 			return -1
 
-		tokens = settings.get(["tokens"])
+		tokens = settings.tokens
 		if len(tokens) == 0:
 			# No iOS devices were registered so skip notification
 			return -2
@@ -153,44 +147,48 @@ class BaseNotification:
 				camera_url = settings.get(["camera_snapshot_url"])
 				turn_on_ifneeded = settings.get_boolean(['turn_HA_light_on_ifneeded'])
 				if camera_url and camera_url.strip():
-					image = self.image(turn_on_ifneeded, camera_url, hflip, vflip, rotate)
+					cache_seconds = settings.get_int(['snapshot_cache_seconds'])
+					image = self.image(turn_on_ifneeded, camera_url, hflip, vflip, rotate, cache_seconds)
 			except:
 				self._logger.info("Could not load image from url")
+			if image:
+				# Serialize image once. All requests of this notification will share it
+				image = PreparedImage(image)
 
-		# For each registered token we will send a push notification
-		# We do it individually since 'printerID' is included so that
-		# iOS app can properly render local notification with
-		# proper printer name
-		used_tokens = []
+		# Send one push notification for all devices that share the same language and printer name. Message is
+		# rendered once per group and the OctoPod APNS service delivers it to all tokens in the request
+		unique_tokens = self._unique_tokens(tokens)
 		last_result = None
-		for token in tokens:
+		groups = self._group_tokens(unique_tokens, settings.get_boolean(["batch_notifications"]))
+		for language_code, printer_name, apns_tokens in groups:
+			# We can send non-silent notifications (the new way) so notifications are rendered even if user
+			# killed the app
+			last_result = self._alerts.send_alert_code(settings, language_code, apns_tokens, url, printer_name,
+													   event_code, category, image, event_param, apns_dict)
+
+		# Requests that need to be sent to each device are sent concurrently
+		calls = []
+		legacy_calls = []  # Position in calls of legacy requests
+		for token in unique_tokens:
 			apns_token = token["apnsToken"]
 			printer_id = token["printerID"]
 
-			# Ignore tokens that already received the notification
-			# This is the case when the same OctoPrint instance is added twice
-			# on the iOS app. Usually one for local address and one for public address
-			if apns_token in used_tokens:
-				continue
-			# Keep track of tokens that received a notification
-			used_tokens.append(apns_token)
-
-			if 'printerName' in token and token["printerName"] is not None:
-				# We can send non-silent notifications (the new way) so notifications are rendered even if user
-				# killed the app
-				printer_name = token["printerName"]
-				language_code = token["languageCode"]
-				last_result = self._alerts.send_alert_code(settings, language_code, apns_token, url, printer_name,
-														   event_code, category, image, event_param, apns_dict)
-			else:
+			if self._is_legacy_token(token) and legacy_code_block:
 				# Legacy mode that uses silent notifications. As user update OctoPod app then they will automatically
 				# switch to the new mode
-				if legacy_code_block:
-					last_result = legacy_code_block(server_url, apns_token, printer_id)
+				legacy_calls.append(len(calls))
+				calls.append((legacy_code_block, (server_url, apns_token, printer_id)))
 
 			if silent_code_block:
-				# Send silent notification to refresh Apple Watch complication
-				silent_code_block(apns_token, image, printer_id, url)
+				# Send silent notification to refresh Apple Watch complication. We do it individually
+				# since 'printerID' is included so that iOS app can properly update the complication
+				calls.append((silent_code_block, (apns_token, image, printer_id, url)))
+
+		if calls:
+			results = self._fan_out(calls)
+			# Result of the last legacy request (in token order) wins
+			for index in legacy_calls:
+				last_result = results[index]
 
 		return last_result
 
@@ -210,36 +208,77 @@ class BaseNotification:
 			self._logger.debug("CustomNotifications - No APNS server has been defined so do nothing")
 			return False
 
-		tokens = settings.get(["tokens"])
+		tokens = settings.tokens
 		if len(tokens) == 0:
 			# No iOS devices were registered so skip notification
 			self._logger.debug("CustomNotifications - No iOS devices were registered so skip notification")
 			return False
 
-		# For each registered token we will send a push notification
-		# We do it individually since 'printerID' is included so that
-		# iOS app can properly render local notification with
-		# proper printer name
-		used_tokens = []
+		if image and not isinstance(image, PreparedImage):
+			# Read image once (e.g. file-like image) and share it with all requests
+			try:
+				image = PreparedImage(image)
+			except Exception as e:
+				self._logger.warning("CustomNotifications - Invalid image: %s" % str(e))
+				return False
+
+		# Send one push notification for all devices that share the same printer name
 		last_result = None
+		url = server_url + '/v1/push_printer'
+		groups = self._group_tokens(self._unique_tokens(tokens), settings.get_boolean(["batch_notifications"]))
+		for language_code, printer_name, apns_tokens in groups:
+			# We can send non-silent notifications (the new way) so notifications are rendered even if user
+			# killed the app
+			result = self._alerts.send_alert(settings, apns_tokens, url, printer_name, message, None, image) < 300
+			last_result = result if last_result is None else last_result and result
+
+		return last_result
+
+	@staticmethod
+	def _unique_tokens(tokens):
+		"""
+		Returns registered tokens without duplicates. The same OctoPrint instance may be added
+		twice on the iOS app (usually one for local address and one for public address) so ignore
+		tokens that will already receive the notification
+
+		:param tokens: tokens registered by OctoPod app
+		:return: list of tokens with unique APNS tokens
+		"""
+		used_tokens = set()
+		unique_tokens = []
 		for token in tokens:
 			apns_token = token["apnsToken"]
-
-			# Ignore tokens that already received the notification
-			# This is the case when the same OctoPrint instance is added twice
-			# on the iOS app. Usually one for local address and one for public address
 			if apns_token in used_tokens:
 				continue
-			# Keep track of tokens that received a notification
-			used_tokens.append(apns_token)
+			used_tokens.add(apns_token)
+			unique_tokens.append(token)
+		return unique_tokens
+
+	@staticmethod
+	def _is_legacy_token(token):
+		""" Old versions of OctoPod app did not report printer name and use silent notifications """
+		return 'printerName' not in token or token["printerName"] is None
 
-			if 'printerName' in token and token["printerName"] is not None:
-				# We can send non-silent notifications (the new way) so notifications are rendered even if user
-				# killed the app
-				printer_name = token["printerName"]
-				url = server_url + '/v1/push_printer'
+	@staticmethod
+	def _group_tokens(tokens, batch=True):
+		"""
+		Group non-legacy tokens by language and printer name so that a single request (with all the tokens
+		of the group) is sent to the OctoPod APNS service for each group
 
-				return self._alerts.send_alert(settings, apns_token, url, printer_name, message, None, image) < 300
+		:param tokens: unique tokens registered by OctoPod app
+		:param batch: False if each token should be sent in its own request
+		:return: list of (language code, printer name, list of APNS tokens)
+		"""
+		groups = OrderedDict()
+		for token in tokens:
+			if BaseNotification._is_legacy_token(token):
+				continue
+			groups.setdefault((token.get("languageCode"), token["printerName"]), []).append(token["apnsToken"])
+		if batch:
+			return [(language_code, printer_name, apns_tokens)
+					for (language_code, printer_name), apns_tokens in groups.items()]
+		return [(language_code, printer_name, [apns_token])
+				for (language_code, printer_name), apns_tokens in groups.items() for apns_token in apns_tokens]
 
 	def _is_printer_printing(self, printer):
 		(completion, print_time_in_seconds, print_time_left_in_seconds) = self._get_progress_data(printer)
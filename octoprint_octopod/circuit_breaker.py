@@ -0,0 +1,60 @@
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(IOError):
+	""" Request was not sent since endpoint is failing """
+	pass
+
+
+class CircuitBreaker:
+	"""
+	Track failures of requests to an endpoint (e.g. OctoPod server or IFTTT). After consecutive failures
+	the circuit opens and requests fail right away instead of waiting for timeouts of a server that is
+	down. Once reset_timeout has passed a single request is let through (half-open) to probe the
+	endpoint. Circuit closes if probe succeeds or opens again if it fails
+	"""
+
+	def __init__(self, name, failure_threshold=3, reset_timeout=30):
+		self.name = name
+		self._failure_threshold = failure_threshold
+		self._reset_timeout = reset_timeout
+		self._lock = threading.Lock()
+		self._state = CLOSED
+		self._failures = 0
+		self._opened_at = 0
+
+	def before_request(self):
+		""" Raise CircuitOpenError if request should not be sent """
+		with self._lock:
+			if self._state == CLOSED:
+				return
+			if self._state == OPEN and time.time() - self._opened_at >= self._reset_timeout:
+				# Let this request probe if endpoint recovered
+				self._state = HALF_OPEN
+				return
+		raise CircuitOpenError("Circuit of %s is %s" % (self.name, self._state))
+
+	def record_success(self):
+		with self._lock:
+			self._state = CLOSED
+			self._failures = 0
+
+	def record_failure(self):
+		with self._lock:
+			self._failures += 1
+			if self._state == HALF_OPEN or self._failures >= self._failure_threshold:
+				self._state = OPEN
+				self._opened_at = time.time()
+
+	def get_state(self):
+		with self._lock:
+			state = self._state
+			if state == OPEN and time.time() - self._opened_at >= self._reset_timeout:
+				# Next request will probe the endpoint
+				state = HALF_OPEN
+			return dict(state=state, failures=self._failures)
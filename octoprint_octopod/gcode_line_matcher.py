@@ -0,0 +1,35 @@
+class GcodeLineMatcher:
+	"""
+	Route lines received from the printer to the detectors interested in them. This runs for every
+	line received over the serial connection so most lines (e.g. 'ok' or temperature reports) are
+	rejected with a single prefix check and detectors are only called when their prefix matches
+	"""
+
+	def __init__(self):
+		self._prefixes = ()
+		self._handlers = {}  # First char of prefix -> list of (prefix, handler)
+		self.line_number = 0  # Number of lines received so far
+
+	def register(self, prefixes, handler):
+		"""
+		Register handler to call with lines that start with any of the specified prefixes
+
+		:param prefixes: tuple of prefixes of lines to match
+		:param handler: function that receives the line and the line number
+		"""
+		for prefix in prefixes:
+			self._prefixes = self._prefixes + (prefix,)
+			self._handlers.setdefault(prefix[0], []).append((prefix, handler))
+
+	def match(self, line):
+		"""
+		Call handlers of the prefixes that the line starts with
+
+		:param line: line received from the printer
+		"""
+		self.line_number += 1
+		if not line.startswith(self._prefixes):
+			return
+		for prefix, handler in self._handlers[line[0]]:
+			if line.startswith(prefix):
+				handler(line, self.line_number)
@@ -0,0 +1,129 @@
+import math
+from array import array
+
+# Samples closer than this number of seconds to the previous one are ignored. Keeps the window
+# covering enough time when firmware autoreports temperatures many times per second
+MIN_SAMPLE_SPACING = 0.9
+# Minimum number of samples needed to estimate the rate and its noise
+MIN_SAMPLES = 3
+
+
+class HeaterWindow:
+	"""
+	Recent (time, temperature) samples of a heater that has some target temperature. Samples are stored
+	in fixed size arrays used as a ring buffer and the window only keeps the samples needed to cover the
+	requested number of seconds. The heating (or cooling) rate is the least-squares slope of the samples.
+	Sums needed for the fit are updated as samples are added or evicted so computing the rate is O(1)
+	"""
+
+	__slots__ = ("target", "direction", "slowest_rate", "_capacity", "_times", "_temps", "_start", "_count",
+				 "_origin", "_sum_t", "_sum_y", "_sum_tt", "_sum_ty", "_sum_yy")
+
+	def __init__(self, capacity, target):
+		self.target = target  # Target temperature of the heater while samples were collected
+		self.direction = 0  # 1 if temperature should go up, -1 if it should go down
+		self._capacity = capacity
+		self._times = array('d', [0]) * capacity
+		self._temps = array('d', [0]) * capacity
+		self.clear()
+
+	def __len__(self):
+		return self._count
+
+	def clear(self):
+		self.slowest_rate = None  # Slowest rate towards target measured while tracking direction
+		self._start = 0
+		self._count = 0
+		self._origin = 0  # Times are stored relative to this time to keep sums small and precise
+		self._sum_t = self._sum_y = self._sum_tt = self._sum_ty = self._sum_yy = 0.0
+
+	def add(self, sample_time, temp, span):
+		"""
+		Add sample to the window and evict old samples that are no longer needed to cover span seconds
+
+		:param sample_time: time when temperature was reported
+		:param temp: actual temperature of the heater
+		:param span: seconds that the window needs to cover
+		"""
+		capacity = self._capacity
+		if self._count:
+			if sample_time - self._origin - self._times[(self._start + self._count - 1) % capacity] < MIN_SAMPLE_SPACING:
+				return
+			# Evict oldest sample if window is full or if next sample already covers the span
+			while self._count == capacity or \
+					(self._count > 1 and sample_time - self._origin - self._times[(self._start + 1) % capacity] >= span):
+				self.__evict()
+		else:
+			self._origin = sample_time
+		t = sample_time - self._origin
+		index = (self._start + self._count) % capacity
+		self._times[index] = t
+		self._temps[index] = temp
+		self._count += 1
+		self._sum_t += t
+		self._sum_y += temp
+		self._sum_tt += t * t
+		self._sum_ty += t * temp
+		self._sum_yy += temp * temp
+
+	def mean_temp(self):
+		""" Returns average temperature of the samples """
+		if not self._count:
+			return None
+		return self._sum_y / self._count
+
+	def duration(self):
+		""" Returns seconds between oldest and newest samples """
+		if not self._count:
+			return 0
+		return self._times[(self._start + self._count - 1) % self._capacity] - self._times[self._start]
+
+	def rate(self):
+		"""
+		Returns least-squares slope of the samples (degrees per second) and its standard error or
+		None if there are not enough samples
+		"""
+		n = self._count
+		if n < MIN_SAMPLES:
+			return None
+		sxx = self._sum_tt - self._sum_t * self._sum_t / n
+		if sxx <= 0:
+			return None
+		sxy = self._sum_ty - self._sum_t * self._sum_y / n
+		syy = self._sum_yy - self._sum_y * self._sum_y / n
+		slope = sxy / sxx
+		# Residuals of the fit are the noise of the readings
+		residuals = max(syy - slope * sxy, 0.0)
+		return slope, math.sqrt(residuals / (n - 2) / sxx)
+
+	def __evict(self):
+		capacity = self._capacity
+		t = self._times[self._start]
+		temp = self._temps[self._start]
+		self._start = (self._start + 1) % capacity
+		self._count -= 1
+		self._sum_t -= t
+		self._sum_y -= temp
+		self._sum_tt -= t * t
+		self._sum_ty -= t * temp
+		self._sum_yy -= temp * temp
+		if self._start == 0:
+			# Once per lap of the ring buffer recompute sums relative to the oldest sample so
+			# that rounding errors do not accumulate and times stay small during long prints
+			self.__rebase()
+
+	def __rebase(self):
+		capacity = self._capacity
+		origin = self._times[self._start] if self._count else 0
+		self._origin += origin
+		self._sum_t = self._sum_y = self._sum_tt = self._sum_ty = self._sum_yy = 0.0
+		for i in range(self._count):
+			index = (self._start + i) % capacity
+			t = self._times[index] - origin
+			temp = self._temps[index]
+			self._times[index] = t
+			self._sum_t += t
+			self._sum_y += temp
+			self._sum_tt += t * t
+			self._sum_ty += t * temp
+			self._sum_yy += temp * temp
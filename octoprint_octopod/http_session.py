@@ -0,0 +1,91 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .circuit_breaker import CircuitBreaker
+
+try:
+	from urllib.parse import urlparse  # Python 3
+except ImportError:
+	from urlparse import urlparse  # Python 2
+
+# Seconds to wait for a connection to be established and for the server to send a response
+CONNECT_TIMEOUT = 4
+READ_TIMEOUT = 10
+# Number of hosts with a pool of connections (e.g. OctoPod server, IFTTT, webcam)
+POOL_CONNECTIONS = 4
+# Number of keep-alive connections to reuse per host
+POOL_MAXSIZE = 8
+
+_session = None
+_session_lock = threading.Lock()
+_timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+_circuit_breakers = {}  # scheme://host:port -> CircuitBreaker
+
+
+def get_session():
+	"""
+	Returns HTTP session shared by all notifications. Session keeps connections alive so
+	that a burst of notifications reuses open connections instead of doing new TCP and TLS
+	handshakes for each request. Session (and its connection pools) can be used from
+	many threads
+	"""
+	global _session
+	if _session is None:
+		with _session_lock:
+			if _session is None:
+				session = requests.Session()
+				adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+				session.mount("http://", adapter)
+				session.mount("https://", adapter)
+				_session = session
+	return _session
+
+
+def configure(connect_timeout, read_timeout):
+	""" Set seconds to wait for a connection and for a response of requests that do not specify a timeout """
+	global _timeout
+	_timeout = (connect_timeout or CONNECT_TIMEOUT, read_timeout or READ_TIMEOUT)
+
+
+def circuit_breaker(url):
+	""" Returns circuit breaker of the endpoint (scheme, host and port) of the URL """
+	parsed_url = urlparse(url)
+	endpoint = "%s://%s" % (parsed_url.scheme, parsed_url.netloc)
+	breaker = _circuit_breakers.get(endpoint)
+	if breaker is None:
+		with _session_lock:
+			breaker = _circuit_breakers.setdefault(endpoint, CircuitBreaker(endpoint))
+	return breaker
+
+
+def get_circuit_breakers_state():
+	""" Returns state of the circuit breaker of each endpoint that received requests """
+	return dict((endpoint, breaker.get_state()) for endpoint, breaker in list(_circuit_breakers.items()))
+
+
+def get(url, **kwargs):
+	kwargs.setdefault("timeout", _timeout)
+	return get_session().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+	"""
+	Post to push services (OctoPod server, IFTTT). Raise CircuitOpenError without sending the request if
+	the endpoint has been failing. Connection errors, timeouts and 5xx responses count as failures
+	"""
+	kwargs.setdefault("timeout", _timeout)
+	breaker = circuit_breaker(url)
+	breaker.before_request()
+	try:
+		response = get_session().post(url, **kwargs)
+	except Exception:
+		# Connection error or timeout (also releases the probe of a half-open circuit)
+		breaker.record_failure()
+		raise
+	if response.status_code >= 500:
+		breaker.record_failure()
+	else:
+		breaker.record_success()
+	return response
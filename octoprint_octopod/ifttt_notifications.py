@@ -1,12 +1,25 @@
-import requests
+from . import http_session
+from .outbox import SHORT_LIVED_TTL_SECONDS, event_ttl
+
+# Name of IFTTT in the outbox
+OUTBOX_TARGET = "ifttt"
+EVENT_URL = "https://maker.ifttt.com/trigger/%s/with/key/%s"
 
 
 class IFTTTAlerts:
 
-	def __init__(self, logger):
+	def __init__(self, logger, dispatcher, outbox, settings_provider):
+		"""
+		:param settings_provider: function that returns current plugin settings
+		"""
 		self._logger = logger
+		self._dispatcher = dispatcher
+		self._outbox = outbox
+		self._settings_provider = settings_provider
+		# Pending events keep the event name and the URL (with the key) is built when retrying
+		outbox.register_target(OUTBOX_TARGET, self.__event_url)
 
-	def fire_event(self, settings, event, value1):
+	def fire_event(self, settings, event, value1, test=False):
 		ifttt_key = settings.get(["ifttt_key"])
 		if not ifttt_key or not ifttt_key.strip():
 			# No IFTTT key has been defined so do nothing
@@ -17,18 +30,42 @@ class IFTTTAlerts:
 			# No printer name for IFTTT has been defined so do nothing
 			return -1
 
-		try:
-			ifttt_event = "octopod-" + event
-			url = "https://maker.ifttt.com/trigger/%s/with/key/%s" % (ifttt_event, ifttt_key)
+		# Fire webhook from a notification worker thread so caller never waits for IFTTT. Events are fired
+		# in order. Events that a newer one replaces (e.g. print-progress) are dropped first if queue is full
+		self._dispatcher.submit_from(self, event in SHORT_LIVED_TTL_SECONDS, self.__fire_event, event, ifttt_key,
+									 ifttt_name, value1, test)
 
-			payload = {'value1': ifttt_name, 'value2': value1, 'value3': ""}
+	# Private functions
 
-			response = requests.post(url, json=payload)
+	def __fire_event(self, event, ifttt_key, ifttt_name, value1, test):
+		ifttt_event = "octopod-" + event
+		url = EVENT_URL % (ifttt_event, ifttt_key)
+
+		payload = {'value1': ifttt_name, 'value2': value1, 'value3': ""}
+		# Test events are never retried since the user is waiting for the result
+		outbox_ttl = 0 if test else event_ttl(event)
+
+		try:
+			response = http_session.post(url, json=payload)
 
 			if response.status_code == 200:
 				self._logger.debug("IFTTT event (%s) fired!" % ifttt_event)
+				self._outbox.on_sent(url, OUTBOX_TARGET)
 			else:
 				self._logger.debug(
 					"Error firing IFTTT event (%s). Response: %s" % (ifttt_event, str(response.status_code)))
+				if response.status_code >= 500:
+					# Fire event later
+					self._outbox.add_to_target(OUTBOX_TARGET, ifttt_event, payload, outbox_ttl)
 		except Exception as e:
 			self._logger.warn("Could not send IFTTT event: %s" % str(e))
+			# Fire event later
+			self._outbox.add_to_target(OUTBOX_TARGET, ifttt_event, payload, outbox_ttl, unreachable=True)
+
+	def __event_url(self, ifttt_event):
+		# Use current key. Pending events are dropped if user removed the key
+		settings = self._settings_provider()
+		ifttt_key = settings.get(["ifttt_key"]) if settings is not None else None
+		if not ifttt_key or not ifttt_key.strip():
+			return None
+		return EVENT_URL % (ifttt_event, ifttt_key)
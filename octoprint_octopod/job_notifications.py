@@ -1,13 +1,14 @@
 import threading
 
 from .base_notification import BaseNotification
+from .prepared_image import PreparedImage
 
 
 class JobNotifications(BaseNotification):
 	_lastPrinterState = None
 
-	def __init__(self, logger, ifttt_alerts, plugin_manager):
-		BaseNotification.__init__(self, logger, plugin_manager)
+	def __init__(self, logger, ifttt_alerts, plugin_manager, dispatcher, alerts):
+		BaseNotification.__init__(self, logger, plugin_manager, dispatcher, alerts)
 		self._ifttt_alerts = ifttt_alerts
 
 	def on_print_progress(self, settings, progress, printer):
@@ -42,8 +43,8 @@ class JobNotifications(BaseNotification):
 			self._alerts.send_job_request(apns_token, None, printer_id, "Printing", progress, url)
 
 		event_param = {'PrintProgress': progress}
-		return self._send_base_notification(settings, True, "Print progress", event_param=event_param,
-											silent_code_block=_send_silent_notification)
+		return self._dispatch_update(self._send_base_notification, settings, True, "Print progress",
+									 event_param=event_param, silent_code_block=_send_silent_notification)
 
 	def send_print_job_notification(self, settings, printer, event_payload, server_url=None, camera_snapshot_url=None,
 									webcam_flipH=None, webcam_flipV=None, webcam_rotate90=None, test=False):
@@ -88,7 +89,7 @@ class JobNotifications(BaseNotification):
 			current_printer_state = "Operational"
 			completion = 100
 
-		tokens = settings.get(["tokens"])
+		tokens = settings.tokens
 		if len(tokens) == 0:
 			# No iOS devices were registered so skip notification
 			return -2
@@ -99,13 +100,20 @@ class JobNotifications(BaseNotification):
 		if completion is None:
 			# No progress information so nothing to report. Return 0 though this value is ignored
 			return 0
-		if test or print_complete_delay_seconds == 0 or completion < 100 or not (
-				was_printing and current_printer_state_id == "FINISHING"):
+		if test:
+			# Test notifications are sent right away since UI needs to know the result
 			last_result = self.__send_print_complete_or_silent_notification(camera_snapshot_url, completion,
 																			current_data, current_printer_state,
 																			current_printer_state_id, settings, test,
 																			tokens, url, was_printing, webcam_flipH,
 																			webcam_flipV, webcam_rotate90)
+		elif print_complete_delay_seconds == 0 or completion < 100 or not (
+				was_printing and current_printer_state_id == "FINISHING"):
+			self._dispatch(self.__send_print_complete_or_silent_notification, camera_snapshot_url, completion,
+						   current_data, current_printer_state, current_printer_state_id, settings, test, tokens,
+						   url, was_printing, webcam_flipH, webcam_flipV, webcam_rotate90)
+			# this value is ignored since it is used for testing
+			last_result = 0
 		else:
 			delayed_task = threading.Timer(print_complete_delay_seconds,
 										   self.__send_print_complete_or_silent_notification,
@@ -148,61 +156,60 @@ class JobNotifications(BaseNotification):
 					camera_url = settings.get(["camera_snapshot_url"])
 				if camera_url and camera_url.strip():
 					turn_on_ifneeded = settings.get_boolean(['turn_HA_light_on_ifneeded'])
-					image = self.image(turn_on_ifneeded, camera_url, hflip, vflip, rotate)
+					cache_seconds = 0 if test else settings.get_int(['snapshot_cache_seconds'])
+					image = self.image(turn_on_ifneeded, camera_url, hflip, vflip, rotate, cache_seconds)
 			except:
 				self._logger.info("Could not load image from url")
+			if image:
+				# Serialize image once. All requests of this notification will share it
+				image = PreparedImage(image)
 		# Send IFTTT Notifications
 		if current_printer_state_id == "ERROR":
 			self._ifttt_alerts.fire_event(settings, "printer-error", current_printer_state)
 		elif (current_printer_state_id == "FINISHING" and was_printing) or test:
-			self._ifttt_alerts.fire_event(settings, "print-complete", "")
-		# For each registered token we will send a push notification
-		# We do it individually since 'printerID' is included so that
-		# iOS app can properly render local notification with
-		# proper printer name
-		used_tokens = []
+			self._ifttt_alerts.fire_event(settings, "print-complete", "", test)
+		# Send one push notification for all devices that share the same language and printer name
+		unique_tokens = self._unique_tokens(tokens)
 		last_result = None
-		for token in tokens:
+		print_complete = (current_printer_state_id == "FINISHING" and was_printing) or test
+		groups = self._group_tokens(unique_tokens, settings.get_boolean(["batch_notifications"]))
+		if current_printer_state_id == "ERROR":
+			for language_code, printer_name, apns_tokens in groups:
+				self._logger.debug(
+					"Sending notification for error message: %s (%s)" % (current_printer_state, printer_name))
+				last_result = self._alerts.send_alert(settings, apns_tokens, url, printer_name,
+													  current_printer_state, None, None)
+		elif print_complete:
+			apns_category = None
+			apns_dict = None
+			if ("job" in current_data and "file" in current_data["job"] and "path" in current_data["job"][
+				"file"] and current_data["job"]["file"]["path"] is not None and "origin" in current_data["job"][
+				"file"] and current_data["job"]["file"]["origin"] is not None):
+				# Define APNS Category so notification shows "Print Again" button
+				apns_category = "printComplete"
+				# Include file information to print again
+				apns_dict = {'filePath': current_data['job']['file']['path'],
+							 'fileOrigin': current_data['job']['file']['origin']}
+			for language_code, printer_name, apns_tokens in groups:
+				last_result = self._alerts.send_alert_code(settings, language_code, apns_tokens, url, printer_name,
+														   "Print complete", apns_category, image, None, apns_dict,
+														   test)
+
+		# Requests that need to be sent to each device are sent concurrently
+		calls = []
+		legacy_calls = []  # Position in calls of legacy requests
+		for token in unique_tokens:
 			apns_token = token["apnsToken"]
 			printer_id = token["printerID"]
 
-			# Ignore tokens that already received the notification
-			# This is the case when the same OctoPrint instance is added twice
-			# on the iOS app. Usually one for local address and one for public address
-			if apns_token in used_tokens:
-				continue
-			# Keep track of tokens that received a notification
-			used_tokens.append(apns_token)
-
-			if 'printerName' in token and token["printerName"] is not None:
-				# We can send non-silent notifications (the new way) so notifications are rendered even if user
-				# killed the app
-				printer_name = token["printerName"]
-				language_code = token["languageCode"]
-				if current_printer_state_id == "ERROR":
-					self._logger.debug(
-						"Sending notification for error message: %s (%s)" % (current_printer_state, printer_name))
-					last_result = self._alerts.send_alert(settings, apns_token, url, printer_name,
-														  current_printer_state, None, None)
-				elif (current_printer_state_id == "FINISHING" and was_printing) or test:
-					apns_category = None
-					apns_dict = None
-					if ("job" in current_data and "file" in current_data["job"] and "path" in current_data["job"][
-						"file"] and current_data["job"]["file"]["path"] is not None and "origin" in current_data["job"][
-						"file"] and current_data["job"]["file"]["origin"] is not None):
-						# Define APNS Category so notification shows "Print Again" button
-						apns_category = "printComplete"
-						# Include file information to print again
-						apns_dict = {'filePath': current_data['job']['file']['path'],
-									 'fileOrigin': current_data['job']['file']['origin']}
-					last_result = self._alerts.send_alert_code(settings, language_code, apns_token, url, printer_name,
-															   "Print complete", apns_category, image, None, apns_dict)
+			if not self._is_legacy_token(token):
+				if print_complete:
 					# Skip the silent notification for finishing at 100%. One for operational at 100% will be sent later
 					continue
 
 				# Send silent notification so that OctoPod app can update complications of Apple Watch app
-				self._alerts.send_job_request(apns_token, image, printer_id, current_printer_state, completion, url,
-											  test)
+				calls.append((self._alerts.send_job_request,
+							  (apns_token, image, printer_id, current_printer_state, completion, url, test)))
 
 			else:
 				if current_printer_state_id == "FINISHING":
@@ -230,13 +237,23 @@ class JobNotifications(BaseNotification):
 							camera_url = settings.get(["camera_snapshot_url"])
 						if camera_url and camera_url.strip():
 							turn_on_ifneeded = settings.get_boolean(['turn_HA_light_on_ifneeded'])
-							image = self.image(turn_on_ifneeded, camera_url, hflip, vflip, rotate)
+							cache_seconds = 0 if test else settings.get_int(['snapshot_cache_seconds'])
+							image = self.image(turn_on_ifneeded, camera_url, hflip, vflip, rotate, cache_seconds)
 					except:
 						self._logger.info("Could not load image from url")
+					if image:
+						image = PreparedImage(image)
 
 				# Legacy mode that uses silent notifications. As user update OctoPod app then they will automatically
 				# switch to the new mode
-				last_result = self._alerts.send_job_request(apns_token, image, printer_id, current_printer_state,
-															completion, url, test)
+				legacy_calls.append(len(calls))
+				calls.append((self._alerts.send_job_request,
+							  (apns_token, image, printer_id, current_printer_state, completion, url, test)))
+
+		if calls:
+			results = self._fan_out(calls)
+			# Result of the last legacy request (in token order) wins
+			for index in legacy_calls:
+				last_result = results[index]
 		return last_result
 
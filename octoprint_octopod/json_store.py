@@ -0,0 +1,59 @@
+import os
+import threading
+
+
+def write_atomically(file_path, text):
+	"""
+	Write text to the file. Text is written to a temporary file that then replaces the file in a
+	single step so the file is never left half written
+
+	:param file_path: file to write
+	:param text: new content of the file
+	"""
+	temp_path = file_path + ".tmp"
+	with open(temp_path, 'w') as outfile:
+		outfile.write(text)
+	getattr(os, "replace", os.rename)(temp_path, file_path)
+
+
+class DebouncedSave:
+	"""
+	Save changes after a delay from a background thread so that many changes in a short time produce
+	a single write and callers never wait for the disk
+	"""
+
+	def __init__(self, save_callback, delay):
+		"""
+		:param save_callback: function without parameters that saves latest changes
+		:param delay: seconds to wait for more changes before saving
+		"""
+		self._save_callback = save_callback
+		self._delay = delay
+		self._lock = threading.Lock()
+		self._save_lock = threading.Lock()
+		self._timer = None
+		self._dirty = False
+
+	def changed(self):
+		""" Schedule a save that will include latest changes """
+		with self._lock:
+			self._dirty = True
+			if self._timer is not None:
+				# Save will include this change
+				return
+			self._timer = threading.Timer(self._delay, self.flush)
+			self._timer.daemon = True
+			self._timer.start()
+
+	def flush(self):
+		""" Save pending changes now """
+		# Saves never overlap so an older save cannot replace a newer one
+		with self._save_lock:
+			with self._lock:
+				if self._timer is not None:
+					self._timer.cancel()
+					self._timer = None
+				if not self._dirty:
+					return
+				self._dirty = False
+			self._save_callback()
@@ -3,8 +3,8 @@ from .base_notification import BaseNotification
 
 class LayerNotifications(BaseNotification):
 
-	def __init__(self, logger, ifttt_alerts, plugin_manager):
-		BaseNotification.__init__(self, logger, plugin_manager)
+	def __init__(self, logger, ifttt_alerts, plugin_manager, dispatcher, alerts):
+		BaseNotification.__init__(self, logger, plugin_manager, dispatcher, alerts)
 		self._layers = []
 		self._ifttt_alerts = ifttt_alerts
 		self.reset_layers()
@@ -38,4 +38,5 @@ class LayerNotifications(BaseNotification):
 		# Send IFTTT Notifications
 		self._ifttt_alerts.fire_event(settings, "layer-changed", current_layer)
 		event_param = {'PrintLayer': current_layer}
-		return self._send_base_notification(settings, True, "layer_changed", event_param=event_param)
+		return self._dispatch_update(self._send_base_notification, settings, True, "layer_changed",
+									 event_param=event_param)
@@ -8,6 +8,10 @@ This module contain factory patter for different hardware platforms. Adding new
 add class with inheriting from SBC. Inside you have to define differences between parent class and child. You can easily
 overwrite methods and parameters. For reference please look at Armbiand and RPi classes.
 
+Temperature is read from the kernel thermal zones (sysfs) of any Linux board when available, even if platform is not
+detected (e.g. Raspberry Pi without vcgencmd). Commands of the Armbian and RPi classes are only used when no thermal
+zone exists.
+
 Last step is to define way of detecting platform type. It could be very different depending on OS.
 
 """
@@ -22,6 +26,9 @@ class SBCFactory(object):
     piSocTypes = (["BCM2708", "BCM2709", "BCM2835", "BCM2711"])
     vcGenPaths = ["/opt/vc/bin/vcgencmd", "/usr/bin/vcgencmd"]
     vcGenPath = None
+    thermalZonesPath = "/sys/class/thermal"
+    # Types of thermal zones that report the SoC/CPU temperature
+    socThermalZoneTypes = ("cpu-thermal", "cpu_thermal", "soc-thermal", "soc_thermal", "cpu0-thermal")
 
     # Create based on class name:
     def factory(self, logger):
@@ -30,12 +37,40 @@ class SBCFactory(object):
         :param logger: global logger
         :return: handler to proper object
         """
+        # Thermal zones do not depend on platform specific tools so look for them first
+        zone = self._find_thermal_zone()
+        if zone:
+            return ThermalZone(logger, zone)
         if self._is_armbian():
             return Armbian(logger)
         elif self._is_rpi(logger):
             return RPi(logger, self.vcGenPath + " measure_temp")
         return SBC()
 
+    def _find_thermal_zone(self):
+        """
+        Find temperature file of the thermal zone of the SoC. First zone is used if no zone
+        reports a known SoC type
+        :return: path to temp file or None if there are no thermal zones
+        """
+        if not os.path.isdir(self.thermalZonesPath):
+            return None
+        zones = []
+        for name in os.listdir(self.thermalZonesPath):
+            match = re.match(r'thermal_zone(\d+)$', name)
+            if match and os.path.exists(os.path.join(self.thermalZonesPath, name, "temp")):
+                zones.append((int(match.group(1)), os.path.join(self.thermalZonesPath, name)))
+        # Sort numerically so that thermal_zone10 comes after thermal_zone2
+        zones.sort()
+        for number, zone_path in zones:
+            try:
+                with open(os.path.join(zone_path, "type"), 'r') as infile:
+                    if infile.read().strip().lower() in self.socThermalZoneTypes:
+                        return os.path.join(zone_path, "temp")
+            except (IOError, OSError):
+                pass
+        return os.path.join(zones[0][1], "temp") if zones else None
+
     def _is_rpi(self, logger):
         """
         Detecting if is RPi - based on original code
@@ -146,3 +181,47 @@ class Armbian(SBC):
             return float(re_output.group(1)) / 1000
 
         return float(re_output.group(1))
+
+
+class ThermalZone(SBC):
+    """
+    Read temperature from a kernel thermal zone (e.g. /sys/class/thermal/thermal_zone0/temp). File is
+    opened once and re-read from the beginning on each check so no process is spawned and no file is
+    opened per check. File reports temperature as an integer in millidegrees Celsius
+    """
+
+    def __init__(self, logger, temp_path):
+        self.is_supported = True
+        self.temp_path = temp_path
+        self._fd = None
+        self._logger = logger
+
+    def check_soc_temp(self):
+        if self.debugMode:
+            import random
+            return str(round(random.uniform(5, 60), 2))
+
+        if self.is_supported:
+            try:
+                if self._fd is None:
+                    self._fd = os.open(self.temp_path, os.O_RDONLY)
+                return int(self._read()) / 1000.0
+            except (OSError, ValueError) as e:
+                self._logger.debug("SoC temperature not found in %s: %s" % (self.temp_path, str(e)))
+                self.is_supported = False
+                self.close()
+
+        return 0
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _read(self):
+        # sysfs regenerates the content of the file when it is read from offset 0
+        if hasattr(os, "pread"):
+            return os.pread(self._fd, 32, 0)
+        # Python 2 does not have pread
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        return os.read(self._fd, 32)
@@ -1,6 +1,5 @@
-import time
-
 from .base_notification import BaseNotification
+from .rate_limiter import rate_limiter
 
 class LiveActivities(BaseNotification):
 
@@ -8,13 +7,13 @@ class LiveActivities(BaseNotification):
 	__LOW_PRIORITY = 5 # Constant value matches DeliveryPriority enum of Pushy's library
 	__MINUTES_BETWEEN_HIGH_PRIORITY = 7 # Use high priority every 7 minutes for progress notifications
 	__MINUTES_BETWEEN_LOW_PRIORITY = 1 # Send up to 1 low priority notification every minute
+	__HIGH_PRIORITY_KEY = "live-activity-high-priority" # Rate limiter key of high priority notifications
+	__LOW_PRIORITY_KEY = "live-activity-low-priority" # Rate limiter key of low priority notifications
 
-	def __init__(self, logger, plugin_manager):
-		BaseNotification.__init__(self, logger, plugin_manager)
+	def __init__(self, logger, plugin_manager, dispatcher, alerts):
+		BaseNotification.__init__(self, logger, plugin_manager, dispatcher, alerts)
 		# TODO Test thread-safety of dictionaries
 		self._live_activities = {} # Track tokens to use for updating Live Activities
-		self._last_high_priority_notification = None  # Keep track of last time a high priority notification was sent
-		self._last_low_priority_notification = None  # Keep track of last time a low priority notification was sent
 		self._printing = False
 
 	def register_live_activity(self, activity_id, token):
@@ -63,16 +62,15 @@ class LiveActivities(BaseNotification):
 
 		# Send live activity notification. Use high priority notification for changes of status
 		tokens = list(self._live_activities.values())
-		self._alerts.send_live_activity_notification(url, tokens, printer_status, completion,
-													 print_time_left_in_seconds, self._printing,
-													 self.__HIGH_PRIORITY)
+		self._dispatch(self._alerts.send_live_activity_notification, url, tokens, printer_status, completion,
+					   print_time_left_in_seconds, self._printing, self.__HIGH_PRIORITY)
 
 		self._logger.debug("Live activity - Activities: {0}, Printing: {1}, Progress: {2}, State: {3} and Time Left: {4}".
 						   format(len(tokens), self._printing, completion, printer_status, print_time_left_in_seconds))
 
 		if self._printing:
-			# Record last time a high priority notification was sent
-			self._last_high_priority_notification = time.time()
+			# Record that a high priority notification was sent
+			rate_limiter.record(LiveActivities.__HIGH_PRIORITY_KEY)
 		else:
 			# Live Activities were ended since we are no longer printing so clean up list
 			self._live_activities.clear()
@@ -90,43 +88,38 @@ class LiveActivities(BaseNotification):
 			# to control number of high priority notifications to send per hour.
 			# Low priority notifications do not ensure that UI of live activity is updated
 			priority = LiveActivities.__LOW_PRIORITY
-			if self._last_high_priority_notification is not None:
-				elapsed_minutes = (time.time() - self._last_high_priority_notification) / 60
-				if elapsed_minutes >= LiveActivities.__MINUTES_BETWEEN_HIGH_PRIORITY:
-					priority = LiveActivities.__HIGH_PRIORITY
+			# High priority is only used once some minutes passed since the last high priority notification
+			# (e.g. when print started)
+			if rate_limiter.allow(LiveActivities.__HIGH_PRIORITY_KEY,
+								  LiveActivities.__MINUTES_BETWEEN_HIGH_PRIORITY * 60, start_empty=True):
+				priority = LiveActivities.__HIGH_PRIORITY
 
 			# Some print jobs do not take many minutes to print so use high priority
 			# on some pre-defined milestones.
 			# TODO Possible optimization is to only do this based on job duration
 			if completion == 20 or completion == 40 or completion == 60 or completion == 80:
 				priority = LiveActivities.__HIGH_PRIORITY
+				rate_limiter.record(LiveActivities.__HIGH_PRIORITY_KEY)
 
 			# Ignore too frequent low priority notifications to minimize
 			# network load on the APNS service
-			if priority == LiveActivities.__LOW_PRIORITY and self._last_low_priority_notification is not None:
-				elapsed_minutes = (time.time() - self._last_low_priority_notification) / 60
-				if elapsed_minutes < LiveActivities.__MINUTES_BETWEEN_LOW_PRIORITY:
-					self._logger.debug(
-						"Live activity - Skipped low priority notification. Progress: {0}".
-						format(completion))
-					return
+			if priority == LiveActivities.__LOW_PRIORITY and \
+					not rate_limiter.allow(LiveActivities.__LOW_PRIORITY_KEY,
+										   LiveActivities.__MINUTES_BETWEEN_LOW_PRIORITY * 60):
+				self._logger.debug(
+					"Live activity - Skipped low priority notification. Progress: {0}".
+					format(completion))
+				return
 
 			# Send live activity notification with proper priority to manage iOS budget of updates
 			tokens = list(self._live_activities.values())
-			self._alerts.send_live_activity_notification(url, tokens, printer_status, completion,
-														 print_time_left_in_seconds, True,
-														 priority)
+			self._dispatch_update(self._alerts.send_live_activity_notification, url, tokens, printer_status,
+								  completion, print_time_left_in_seconds, True, priority)
 
 			self._logger.debug(
 				"Live activity - Activities: {0}, Priority: {1}, Progress: {2}, State: {3} and Time Left: {4}".
 				format(len(tokens), priority, completion, printer_status, print_time_left_in_seconds))
 
-			if priority == LiveActivities.__HIGH_PRIORITY:
-				# Record last time a high priority notification was sent
-				self._last_high_priority_notification = time.time()
-			else:
-				self._last_low_priority_notification = time.time()
-
 	def __get_service_url(self, settings):
 		server_url = self._get_server_url(settings)
 		if not server_url or not server_url.strip():
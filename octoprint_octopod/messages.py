@@ -0,0 +1,295 @@
+# coding=utf-8
+import threading
+from string import Formatter
+
+# Languages reported by OctoPod app that use messages of another language
+LANGUAGE_ALIASES = {
+	'es-419': 'es',  # Default to Spanish instead of Latin American Spanish
+	'lt': 'lt-LT',
+	'zh': 'zh-Hans'
+}
+# Language to use when there are no messages for the language of the device
+DEFAULT_LANGUAGE = 'en'
+
+_lock = threading.Lock()
+_templates = None  # language -> event code -> MessageTemplate. Never modified once loaded
+_resolved_languages = {}  # language reported by OctoPod app -> language of the messages to use
+
+
+class MessageTemplate:
+	"""
+	Message of an event code in a language. Template is parsed once so rendering only
+	concatenates the literal text with the values of the parameters
+	"""
+
+	__slots__ = ("text", "_parts")
+
+	def __init__(self, text):
+		self.text = text
+		# Tuples of (literal text, parameter name, format spec, conversion)
+		self._parts = tuple(Formatter().parse(text))
+
+	def render(self, params=None):
+		"""
+		Returns message with {Parameter} replaced by the value of the parameter
+
+		:param params: Optional. Dictionary with value of the parameters. Text is returned untouched if None
+		"""
+		if params is None:
+			return self.text
+		chunks = []
+		for literal, name, format_spec, conversion in self._parts:
+			chunks.append(literal)
+			if name is not None:
+				value = params[name]
+				if conversion == 'r':
+					value = repr(value)
+				elif conversion == 's':
+					value = str(value)
+				chunks.append(format(value, format_spec or ""))
+		return "".join(chunks)
+
+
+def get_template(language_code, event_code):
+	"""
+	Returns template of the message of the event code in the language of the device. English
+	message is returned if there is no translation for the language
+
+	:param language_code: Language reported by OctoPod app (e.g. es-419 or zh)
+	:param event_code: Code representing the message to send
+	:return: MessageTemplate or None if event code is unknown
+	"""
+	templates = _load_templates()
+	template = templates[resolve_language(language_code)].get(event_code)
+	if template is None:
+		template = templates[DEFAULT_LANGUAGE].get(event_code)
+	return template
+
+
+def resolve_language(language_code):
+	""" Returns language of the messages to use for the language reported by OctoPod app """
+	language = _resolved_languages.get(language_code)
+	if language is None:
+		templates = _load_templates()
+		language = LANGUAGE_ALIASES.get(language_code, language_code)
+		if language not in templates and language:
+			# Try base language (e.g. pt-BR -> pt) or a variant of it (e.g. lt -> lt-LT)
+			base = language.split('-')[0]
+			variants = sorted(lang for lang in templates if lang.split('-')[0] == base)
+			language = base if base in templates else variants[0] if variants else None
+		if language not in templates:
+			language = DEFAULT_LANGUAGE
+		_resolved_languages[language_code] = language
+	return language
+
+
+def _load_templates():
+	global _templates
+	if _templates is None:
+		with _lock:
+			if _templates is None:
+				templates = {}
+				for language, events in _messages().items():
+					templates[language] = dict((event_code, MessageTemplate(text)) for event_code, text in events.items())
+				_templates = templates
+	return _templates
+
+
+def _messages():
+	""" Messages of each event code in each language supported by OctoPod app """
+	return {
+		'en': {
+			"Print complete": 'Print complete',
+			"Print progress": "Progress {PrintProgress}%",
+			"bed-cooled": 'Printer bed below specified temperature threshold ({BedThreshold}°)',
+			"bed-warmed": 'Printer bed warmed to specified temperature ({BedThreshold}°) for {Duration} minutes',
+			"mmu-event": 'MMU Requires User Assistance',
+			"paused-user-event": 'Printer paused for user',
+			"tool0-cooled": 'Extruder below specified temperature threshold ({Tool0Threshold}°)',
+			"tool0-warmed": 'Extruder warmed to specified temperature ({Tool0Threshold}°)',
+			"tool-cooled": 'Extruder {ToolName} below specified temperature threshold ({ToolThreshold}°)',
+			"tool-warmed": 'Extruder {ToolName} warmed to specified temperature ({ToolThreshold}°)',
+			"chamber-cooled": 'Chamber below specified temperature threshold ({ChamberThreshold}°)',
+			"chamber-warmed": 'Chamber warmed to specified temperature ({ChamberThreshold}°)',
+			"palette2-error-while-printing": 'Error {PaletteError} occurred on Palette 2. Your print has been paused',
+			"layer_changed": 'Layer {PrintLayer}',
+			"soc_temp_exceeded": 'SoC Temperature ({SoCTemp}°) above threshold {SoCThreshold}°',
+			"thermal-runaway": 'DANGER: Possible thermal runaway detected!'
+		},
+		'es': {
+			"Print complete": 'Impresión completa',
+			"Print progress": "Progreso {PrintProgress}%",
+			"bed-cooled": 'Cama de la impresora por debajo del umbral de temperatura especificado ({BedThreshold}°)',
+			"bed-warmed": 'Cama de la impresora calentada a la temperatura ({BedThreshold}°) durante {Duration} minutos',
+			"mmu-event": 'MMU requiere asistencia del usuario',
+			"paused-user-event": 'Impresora en pausa esperando al usuario',
+			"tool0-cooled": 'Extrusora por debajo del umbral de temperatura especificado ({Tool0Threshold}°)',
+			"tool0-warmed": 'Extrusora calentada a la temperatura especificada ({Tool0Threshold}°)',
+			"tool-cooled": 'Extrusora {ToolName} por debajo del umbral de temperatura especificado ({ToolThreshold}°)',
+			"tool-warmed": 'Extrusora {ToolName} calentada a la temperatura especificada ({ToolThreshold}°)',
+			"palette2-error-while-printing": 'Error {PaletteError} en Palette 2. Su impresión ha sido suspendida',
+			"layer_changed": 'Capa {PrintLayer}',
+			"soc_temp_exceeded": 'Temperatura del SoC ({SoCTemp}°) por arriba de {SoCThreshold}°',
+			"thermal-runaway": 'PELIGRO: ¡Posible fuga térmica detectada!'
+		},
+		'cs': {
+			"Print complete": 'Tisk dokončen',
+			"Print progress": "Vytištěno {PrintProgress}%",
+			"bed-cooled": 'Teplota podložky pod nastavenou mezí ({BedThreshold}°)',
+			"bed-warmed": 'Podložka nahřáta na nastavenou teplotu ({BedThreshold}°) a dobu ({Duration} minut)',
+			"mmu-event": 'MMU vyžaduje asistenci uživatele',
+			"paused-user-event": 'Tiskárna čeká na uživatele',
+			"tool0-cooled": 'Tryska se ochladila na požadované teploty ({Tool0Threshold}°)',
+			"tool0-warmed": 'Tryska se zahřeje na stanovenou teplotu ({Tool0Threshold}°)',
+			"tool-cooled": 'Tryska {ToolName} se ochladila na požadované teploty ({ToolThreshold}°)',
+			"tool-warmed": 'Tryska {ToolName} se zahřeje na stanovenou teplotu ({ToolThreshold}°)',
+			"palette2-error-while-printing": 'Nastala chyba {PaletteError} na Palette 2. Tisk byl pozastaven',
+			"layer_changed": 'Vrstva {PrintLayer}',
+			"soc_temp_exceeded": 'Teplota SoC ({SoCTemp}°) přesahuje hranici {SoCThreshold}°',
+			"thermal-runaway": 'NEBEZPEČÍ: Detekována možná ztráta teploty!'
+		},
+		'de': {
+			"Print complete": 'Druck vollständig',
+			"Print progress": "Fortschritt {PrintProgress}%",
+			"bed-cooled": 'Druckbett unterhalb der vorgegebenen Temperaturschwelle ({BedThreshold}°)',
+			"bed-warmed": 'Druckbett auf vorgegebene Temperatur ({BedThreshold}°) für gewählte Zeit aufgeheizt ({Duration} Minuten verstrichen)',
+			"mmu-event": 'MMU fordert Hilfestellung',
+			"paused-user-event": 'Drucker angehalten für Benutzer',
+			"tool0-cooled": 'Extruder unterhalb der vorgegebenen Schwelle ({Tool0Threshold}°)',
+			"tool0-warmed": 'Extruder auf spezifizierte Temperatur erwärmt ({Tool0Threshold}°)',
+			"tool-cooled": 'Extruder {ToolName} unterhalb der vorgegebenen Schwelle ({ToolThreshold}°)',
+			"tool-warmed": 'Extruder {ToolName} auf spezifizierte Temperatur erwärmt ({ToolThreshold}°)',
+			"palette2-error-while-printing": 'Fehler {PaletteError} auf Palette 2 aufgetreten. Dein Druck wurde pausiert',
+			"layer_changed": 'Schicht {PrintLayer}',
+			"soc_temp_exceeded": 'SoC Temperatur ({SoCTemp}°) oberhalb der Schwelle {SoCThreshold}°',
+			"thermal-runaway": 'GEFAHR: Möglichen thermischen Runaway erkannt!'
+		},
+		'it': {
+			"Print complete": 'Stampa completata',
+			"Print progress": "Avanzamento {PrintProgress}%",
+			"bed-cooled": 'Piatto della stampante sotto la soglia di temperatura specificata ({BedThreshold}°)',
+			"bed-warmed": 'Piatto della stampante riscaldato alla temperatura ({BedThreshold}°) e per la durata specificate ({Duration} minuti)',
+			"mmu-event": 'MMU richiede l\'intervento dell\'utente',
+			"paused-user-event": 'Stampante in pausa, in attesa dell\'utente',
+			"tool0-cooled": 'Estensore sotto la soglia di temperatura specificata ({Tool0Threshold}°)',
+			"tool0-warmed": 'Estensore riscaldato alla temperatura specificata ({Tool0Threshold}°)',
+			"tool-cooled": 'Estensore {ToolName} sotto la soglia di temperatura specificata ({ToolThreshold}°)',
+			"tool-warmed": 'Estensore {ToolName} riscaldato alla temperatura specificata ({ToolThreshold}°)',
+			"palette2-error-while-printing": 'Errore {PaletteError} su Palette 2. La tua stampa è in pausa',
+			"layer_changed": 'Layer {PrintLayer}',
+			"soc_temp_exceeded": 'Temperatura SoC ({SoCTemp}°) oltre la soglia di {SoCThreshold}°',
+			"thermal-runaway": 'PERICOLO: è stato rilevata una possibile fuga termica (thermal runaway)!'
+		},
+		'lt-LT': {
+			"Print complete": 'Baigta',
+			"Print progress": "Progresas {PrintProgress}%",
+			"bed-cooled": 'Paviršius atvėso ({BedThreshold}°)',
+			"bed-warmed": 'Paviršius pasiekė nustatytą temperatūrą ({BedThreshold}°)',
+			"mmu-event": 'MMU reikalauja pagalbos',
+			"paused-user-event": 'Spausdintuvas laukia vartotojo',
+			"tool0-cooled": 'Ekstruderis žemiau nurodytos temperatūros ribos ({Tool0Threshold}°)',
+			"tool0-warmed": 'Ekstruderis pašildomas iki nurodytos temperatūros ({Tool0Threshold}°)',
+			"tool-cooled": 'Ekstruderis {ToolName} žemiau nurodytos temperatūros ribos ({ToolThreshold}°)',
+			"tool-warmed": 'Ekstruderis {ToolName} pašildomas iki nurodytos temperatūros ({ToolThreshold}°)',
+			"palette2-error-while-printing": 'Klaida {PaletteError} ištiko Palette 2. Įjungta pauzė',
+			"layer_changed": 'Sluoksnis {PrintLayer}',
+			"soc_temp_exceeded": 'SoC temparatūra ({SoCTemp}°) virš ribos {SoCThreshold}°',
+			"thermal-runaway": 'PAVOJUS! Galimai aptiktas temperatūros nuokrypis'
+		},
+		'nb': {
+			"Print complete": 'Utskrift ferdig',
+			"Print progress": "Fremdrift {PrintProgress}%",
+			"bed-cooled": 'Skriveflate under spesifisert temperaturgrense ({BedThreshold}°)',
+			"bed-warmed": 'Skriveflate varmet til spesifisert temperatur ({BedThreshold}°) og varighet ({Duration} minutter)',
+			"mmu-event": 'MMU krever tilsyn',
+			"paused-user-event": 'Skriver venter på bruker',
+			"tool0-cooled": 'Ekstruder under spesifisert temperaturgrense ({Tool0Threshold}°)',
+			"tool0-warmed": 'Ekstruder varmet opp til spesifisert temperatur ({Tool0Threshold}°)',
+			"tool-cooled": 'Ekstruder {ToolName} under spesifisert temperaturgrense ({ToolThreshold}°)',
+			"tool-warmed": 'Ekstruder {ToolName} varmet opp til spesifisert temperatur ({ToolThreshold}°)',
+			"palette2-error-while-printing": 'Feil {PaletteError} oppstod på Palette 2. Din print er satt på pause',
+			"layer_changed": 'Lag {PrintLayer}',
+			"soc_temp_exceeded": 'SoC Temperatur ({SoCTemp}°) over terskelen {SoCThreshold}°',
+			"thermal-runaway": 'FARE: Mulig termisk runaway oppdaget!'
+		},
+		'sv': {
+			"Print complete": 'Utskrift klar',
+			"Print progress": "Framsteg {PrintProgress}%",
+			"bed-cooled": 'Skrivarbädd under angiven temperaturgräns ({BedThreshold}°)',
+			"bed-warmed": 'Skrivarbädd uppvärmd till angiven temperatur ({BedThreshold}°) och varaktighet ({Duration} minuter)',
+			"mmu-event": 'MMU kräver användarhjälp',
+			"paused-user-event": 'Skrivare pausad för användare',
+			"tool0-cooled": 'Extruder under angiven temperaturgräns ({Tool0Threshold}°)',
+			"tool0-warmed": 'Extruder värms upp till specificerad temperatur ({Tool0Threshold}°)',
+			"tool-cooled": 'Extruder {ToolName} under angiven temperaturgräns ({ToolThreshold}°)',
+			"tool-warmed": 'Extruder {ToolName} värms upp till specificerad temperatur ({ToolThreshold}°)',
+			"palette2-error-while-printing": 'Fel {PaletteError} inträffade på Palette 2. Din utskrift har pausats',
+			"layer_changed": 'Lager {PrintLayer}',
+			"soc_temp_exceeded": 'SoC-temperatur ({SoCTemp}°) över tröskeln {SoCThreshold}°',
+			"thermal-runaway": 'VARNING: Möjlig skenande uppvärmning upptäckt!'
+		},
+		'fr': {
+			"Print complete": 'Impression terminée',
+			"Print progress": "Progression {PrintProgress}%",
+			"bed-cooled": 'Température du plateau en dessous du seuil spécifié ({BedThreshold}°)',
+			"bed-warmed": 'Plateau chauffé à la température ({BedThreshold}°) et durée spécifiées ({Duration} minutes écoulées)',
+			"mmu-event": 'Le MMU demande une assistance',
+			"paused-user-event": 'Imprimante en pause pour l’utilisateur',
+			"tool0-cooled": 'Extrudeur en dessous du seuil spécifié ({Tool0Threshold}°)',
+			"tool0-warmed": 'Extrudeuse chauffée à la température spécifiée ({Tool0Threshold}°)',
+			"tool-cooled": 'Extrudeur {ToolName} en dessous du seuil spécifié ({ToolThreshold}°)',
+			"tool-warmed": 'Extrudeuse {ToolName} chauffée à la température spécifiée ({ToolThreshold}°)',
+			"palette2-error-while-printing": 'Erreur {PaletteError} sur Palette 2. Impression en pause',
+			"layer_changed": 'Layer {PrintLayer}',
+			"soc_temp_exceeded": 'SoC Température ({SoCTemp}°) au-dessus du seuil {SoCThreshold}°',
+			"thermal-runaway": 'DANGER: emballement thermique possible détecté !'
+		},
+		'ru': {
+			"Print complete": 'Печать завершена',
+			"Print progress": "Прогресс {PrintProgress}%",
+			"bed-cooled": 'Температурный стола принтера ниже заданного порог ({BedThreshold}°)',
+			"bed-warmed": 'Стол принтера нагревается до заданной температуры ({BedThreshold}°)',
+			"mmu-event": 'MMU требуется помощь пользователя',
+			"paused-user-event": 'Принтер приостановлен для пользователя',
+			"tool0-cooled": 'Температурный порог экструдера ниже заданного ({Tool0Threshold}°)',
+			"tool0-warmed": 'Экструдер нагрет до заданной температуры ({Tool0Threshold}°)',
+			"tool-cooled": 'Температурный порог экструдера {ToolName} ниже заданного ({ToolThreshold}°)',
+			"tool-warmed": 'Экструдер {ToolName} нагрет до заданной температуры ({ToolThreshold}°)',
+			"palette2-error-while-printing": 'Произошла ошибка {PaletteError} в Palette 2. Печать была приостановлена',
+			"layer_changed": 'Слой {PrintLayer}',
+			"soc_temp_exceeded": 'Температура SoC ({SoCTemp}°) выше порога {SoCThreshold}°',
+			"thermal-runaway": 'ОПАСНОСТЬ: Возможный термический бег выявлен!'
+		},
+		'nl': {
+			"Print complete": 'Print compleet',
+			"Print progress": "Voortgang {PrintProgress}%",
+			"bed-cooled": 'Printerbed onder de opgegeven temperatuurdrempel ({BedThreshold}°)',
+			"bed-warmed": 'Printerbed opgewarmd tot gespecificeerde temperatuur ({BedThreshold}°) en duur ({Duration} minuten verstreken)',
+			"mmu-event": 'MMU vereist gebruikershulp',
+			"paused-user-event": 'Printer is gepauzeerd voor gebruiker',
+			"tool0-cooled": 'Extruder onder de opgegeven temperatuurdrempelwaarde ({Tool0Threshold}°)',
+			"tool0-warmed": 'Extruder verwarmd tot gespecificeerde temperatuur ({Tool0Threshold}°)',
+			"tool-cooled": 'Extruder {ToolName} onder de opgegeven temperatuurdrempelwaarde ({ToolThreshold}°)',
+			"tool-warmed": 'Extruder {ToolName} verwarmd tot gespecificeerde temperatuur ({ToolThreshold}°)',
+			"palette2-error-while-printing": 'Fout {PaletteError} heeft plaatsgevonden op palet 2. Uw afdruk is gepauzeerd',
+			"layer_changed": 'Laag {PrintLayer}',
+			"soc_temp_exceeded": 'SoC-temperatuur ({SoCTemp}°) boven drempel {SoCThreshold}°',
+			"thermal-runaway": 'Gevaar: mogelijk thermal runaway gedecteerd!'
+		},
+		'zh-Hans': {
+			"Print complete": '打印完成',
+			"Print progress": "打印 {PrintProgress}％",
+			"bed-cooled": '打印机床低于指定温度阈值 ({BedThreshold}°)',
+			"bed-warmed": '打印机床加热到指定的温 ({BedThreshold}°) 度和持续时间 ({Duration} 分钟)',
+			"mmu-event": 'MMU 需要用户协助',
+			"paused-user-event": '打印机为用户暂停',
+			"tool0-cooled": '挤出机低于指定温度阈值 ({Tool0Threshold}°)',
+			"tool0-warmed": '挤出机加热到指定温度 ({Tool0Threshold}°)',
+			"tool-cooled": '挤出机 {ToolName} 低于指定温度阈值 ({ToolThreshold}°)',
+			"tool-warmed": '挤出机 {ToolName} 加热到指定温度 ({ToolThreshold}°)',
+			"palette2-error-while-printing": '错误 {PaletteError} 发生在Palette 2 上。您的打印已暂停',
+			"layer_changed": '{PrintLayer} 层',
+			"soc_temp_exceeded": 'SoC 温度 ({SoCTemp}°) 高于阈值 {SoCThreshold}°',
+			"thermal-runaway": '危险：检测到可能的热失控'
+		}
+	}
@@ -1,69 +1,62 @@
 import time
 
 from .base_notification import BaseNotification
+from .rate_limiter import rate_limiter
 
 
 class MMUAssistance(BaseNotification):
 
-	def __init__(self, logger, ifttt_alerts, plugin_manager):
-		BaseNotification.__init__(self, logger, plugin_manager)
-		self._ifttt_alerts = ifttt_alerts
-		self._mmu_lines_skipped = None
-		self._last_notification = None  # Keep track of when was user alerted last time. Helps avoid spamming
-		self._snooze_end_time = time.time()  # Track when snooze for mmu events ends. Assume snooze already expired
-
-	def process_received_gcode(self, settings, line):
-		# MMU user assistance detection
-		# Firmware will use 2 different lines to indicate the there is an MMU issue
-		# and user assistance is required. There could be other lines present in the
-		# terminal between the 2 relevant lines
+	# Firmware will use 2 different lines to indicate the there is an MMU issue
+	# and user assistance is required. There could be other lines present in the
+	# terminal between the 2 relevant lines
+	BEGIN_MOVE_PREFIX = "mmu_get_response - begin move: T-code"
+	RESPONSE_PREFIX = "mmu_get_response() returning: 0"
+	RECEIVED_GCODE_PREFIXES = (BEGIN_MOVE_PREFIX, RESPONSE_PREFIX)
+	MAX_LINES_TO_RESPONSE = 6  # Give up waiting for the second line after these many lines
+	EVENT_CODE = "mmu-event"
 
-		# if line.startswith("Not SD printing"):
-		if line.startswith("mmu_get_response - begin move: T-code"):
-			self._mmu_lines_skipped = 0
-		else:
-			if self._mmu_lines_skipped is not None:
-				if self._mmu_lines_skipped > 5:
-					# We give up waiting for the second line to be detected. False alert.
-					# Reset counter
-					self._mmu_lines_skipped = None
-				# elif line.startswith("wait"):
-				elif line.startswith("mmu_get_response() returning: 0"):
-					# Check if we never alerted or 5 minutes have passed since last alert
-					mmu_interval = settings.get_int(['mmu_interval'])
-					if self._last_notification is None or (time.time() - self._last_notification) / 60 > mmu_interval:
-						self._logger.info("*** MMU Requires User Assistance ***")
-						# Record last time we sent notification
-						self._last_notification = time.time()
-						# Send APNS Notification only if interval is not zero (user requested to
-						# shutdown this notification) and there is no active snooze for MMU events
-						if mmu_interval > 0 and time.time() > self._snooze_end_time:
-							self.__send__mmu_notification(settings)
-						else:
-							self._logger.debug("MMU Notification skipped. Snoozing until {0}"
-											   .format(time.ctime(self._snooze_end_time)))
+	def __init__(self, logger, ifttt_alerts, plugin_manager, dispatcher, alerts):
+		BaseNotification.__init__(self, logger, plugin_manager, dispatcher, alerts)
+		self._ifttt_alerts = ifttt_alerts
+		self._begin_move_line_number = None  # Line number where first line was detected
 
-				# Second line found, reset counter now
-					self._mmu_lines_skipped = None
-				else:
-					self._mmu_lines_skipped += 1
+	def process_received_gcode(self, settings, line, line_number):
+		"""
+		MMU user assistance detection. Only lines that start with RECEIVED_GCODE_PREFIXES
+		need to be processed
 
-		# Always return what we parsed
-		return line
+		:param settings: Plugin settings
+		:param line: line received from the printer
+		:param line_number: number of the line received from the printer
+		"""
+		if line.startswith(self.BEGIN_MOVE_PREFIX):
+			self._begin_move_line_number = line_number
+		elif self._begin_move_line_number is not None and line.startswith(self.RESPONSE_PREFIX):
+			# Ignore second line if it took too many lines to arrive. False alert
+			if line_number - self._begin_move_line_number <= self.MAX_LINES_TO_RESPONSE:
+				# Check if we never alerted or 5 minutes have passed since last alert
+				mmu_interval = settings.mmu_interval
+				if rate_limiter.allow(self.EVENT_CODE, mmu_interval * 60):
+					self._logger.info("*** MMU Requires User Assistance ***")
+					# Send APNS Notification only if interval is not zero (user requested to
+					# shutdown this notification) and there is no active snooze for MMU events
+					if mmu_interval > 0 and not rate_limiter.is_snoozed(self.EVENT_CODE):
+						self.__send__mmu_notification(settings)
+					elif mmu_interval > 0:
+						self._logger.debug("MMU Notification skipped. Snoozing until {0}"
+										   .format(time.ctime(rate_limiter.snooze_end_time(self.EVENT_CODE))))
 
-	def snooze(self, minutes):
-		"""Snooze MMU events for the specified number of minutes"""
-		self._snooze_end_time = time.time() + (minutes * 60)
-		self._logger.debug("MMU Notification snoozing until {0}".format(time.ctime(self._snooze_end_time)))
+			# Second line found, reset now
+			self._begin_move_line_number = None
 
 	##~~ Private functions - MMU Notifications
 
 	def __send__mmu_notification(self, settings):
 		# Send IFTTT Notifications
-		self._ifttt_alerts.fire_event(settings, "mmu-event", "")
+		self._ifttt_alerts.fire_event(settings, self.EVENT_CODE, "")
 
-		return self._send_base_notification(settings, False, "mmu-event", "mmuSnoozeActions",
-											legacy_code_block=self._send_legacy_notification)
+		return self._dispatch(self._send_base_notification, settings, False, self.EVENT_CODE, "mmuSnoozeActions",
+							  legacy_code_block=self._send_legacy_notification)
 
 	def _send_legacy_notification(self, server_url, apns_token, printer_id):
 		# Legacy mode that uses silent notifications. As user update OctoPod app then they will automatically
@@ -0,0 +1,273 @@
+import threading
+import time
+from collections import deque
+from functools import partial
+
+try:
+	import queue  # Python 3
+except ImportError:
+	import Queue as queue  # Python 2
+
+# Tells a worker thread to stop
+_STOP = object()
+
+
+class NotificationDispatcher:
+	"""
+	Run notification work (camera snapshots, OctoPod push requests, IFTTT webhooks) in a small pool of
+	worker threads. Detectors are called from OctoPrint hooks that run in the serial communication thread,
+	so they must never wait for network I/O. Submitting work returns right away. Work of the same source
+	(e.g. a notifier) runs in the order it was submitted and one at a time so that updates of printer state
+	never arrive out of order. Work of different sources runs concurrently. When the queue is full, queued
+	work that a newer update replaces (e.g. progress) is dropped (and counted) instead of blocking the
+	caller. Other work (e.g. thermal runaway or printer error alerts) is never dropped
+	"""
+
+	def __init__(self, logger, max_workers=2, max_queue_size=50, max_fan_out_workers=4, fan_out_timeout=20):
+		self._logger = logger
+		self._fan_out = FanOut(logger, max_fan_out_workers, fan_out_timeout)
+		self._pool = _WorkerPool(logger, "OctoPodNotifications", max_workers)
+		self._max_queue_size = max_queue_size
+		self._lanes = {}  # Source -> deque of queued work. Present while source has work queued or running
+		self._queued = 0
+		self._sequence = 0
+		self._lock = threading.Lock()
+		self._submitted = 0
+		self._completed = 0
+		self._failed = 0
+		self._dropped = 0
+
+	def submit(self, code_block, *args, **kwargs):
+		"""
+		Queue code to be executed by a worker thread. Never blocks. Work is never dropped
+
+		:param code_block: function to execute
+		:return: True since work was queued
+		"""
+		return self.submit_from(None, False, code_block, *args, **kwargs)
+
+	def submit_from(self, source, droppable, code_block, *args, **kwargs):
+		"""
+		Queue code to be executed by a worker thread after work previously submitted by the same source.
+		Never blocks.
+
+		:param source: object that submits the work (e.g. notifier). None is also a source
+		:param droppable: True if work can be dropped when queue is full since a newer update replaces it
+		(e.g. progress notifications)
+		:param code_block: function to execute
+		:return: True if work was queued or False if queue was full and work was dropped
+		"""
+		with self._lock:
+			if self._queued >= self._max_queue_size and not self.__drop_oldest_droppable():
+				if droppable:
+					self._dropped += 1
+					self._logger.warning("Notification queue is full. Dropped notification (%s dropped so far)"
+										 % self._dropped)
+					return False
+				self._logger.warning("Notification queue is full. Queuing notification anyway")
+			self._sequence += 1
+			lane = self._lanes.get(source)
+			if lane is None:
+				lane = deque()
+				self._lanes[source] = lane
+				self._pool.execute(partial(self.__run_next, source))
+			lane.append((self._sequence, droppable, code_block, args, kwargs))
+			self._queued += 1
+			self._submitted += 1
+		return True
+
+	def fan_out(self, calls):
+		"""
+		Execute the requests of a notification (e.g. one per device) concurrently and wait for them
+
+		:param calls: list of (function, args) to execute
+		:return: list with the result of each call in the same order as calls
+		"""
+		return self._fan_out.run(calls)
+
+	def get_stats(self):
+		""" Returns queue depth and counters of processed and dropped work """
+		with self._lock:
+			return dict(queued=self._queued, submitted=self._submitted, completed=self._completed,
+						failed=self._failed, dropped=self._dropped, workers=self._pool.size())
+
+	def shutdown(self):
+		""" Stop worker threads once they are done with queued work """
+		self._fan_out.shutdown()
+		self._pool.shutdown()
+
+	# Private functions
+
+	def __drop_oldest_droppable(self):
+		""" Drop oldest queued work that can be dropped. Returns False if there was none """
+		oldest_lane = oldest_work = None
+		for lane in self._lanes.values():
+			for work in lane:
+				if work[1]:
+					if oldest_work is None or work[0] < oldest_work[0]:
+						oldest_lane, oldest_work = lane, work
+					# Rest of the lane is newer
+					break
+		if oldest_work is None:
+			return False
+		# Lane may become empty. Its pending task discards it
+		oldest_lane.remove(oldest_work)
+		self._queued -= 1
+		self._dropped += 1
+		self._logger.warning("Notification queue is full. Dropped queued notification (%s dropped so far)"
+							 % self._dropped)
+		return True
+
+	def __run_next(self, source):
+		""" Run next work of the source. Only one task of each source is queued in the pool at a time """
+		with self._lock:
+			lane = self._lanes[source]
+			if not lane:
+				# Queued work of the source was dropped
+				del self._lanes[source]
+				return
+			sequence, droppable, code_block, args, kwargs = lane.popleft()
+			self._queued -= 1
+		try:
+			code_block(*args, **kwargs)
+			with self._lock:
+				self._completed += 1
+		except Exception as e:
+			with self._lock:
+				self._failed += 1
+			self._logger.exception("Error sending notification: %s" % str(e))
+		with self._lock:
+			if lane:
+				# Let other sources run before the next work of this source
+				self._pool.execute(partial(self.__run_next, source))
+			else:
+				del self._lanes[source]
+
+
+class FanOut:
+	"""
+	Execute the requests of a single notification (e.g. one silent notification per device) concurrently
+	in a bounded pool of threads so that sending a notification takes about one round trip instead of one
+	per device. Threads are not shared with the dispatcher since dispatcher workers wait for these requests.
+	Caller waits until all requests finished or the deadline of the notification was reached
+	"""
+
+	def __init__(self, logger, max_workers, timeout):
+		self._logger = logger
+		self._timeout = timeout
+		self._pool = _WorkerPool(logger, "OctoPodFanOut", max_workers)
+
+	def run(self, calls):
+		"""
+		:param calls: list of (function, args) to execute
+		:return: list with the result of each call in the same order as calls. Result is None if call
+		failed or did not finish before the deadline
+		"""
+		if len(calls) <= 1:
+			# Nothing to parallelize
+			return [self.__execute(code_block, args) for code_block, args in calls]
+		batch = _FanOutBatch(len(calls))
+		for index, (code_block, args) in enumerate(calls):
+			self._pool.execute(partial(self.__run_call, batch, index, code_block, args))
+		if not batch.wait(self._timeout):
+			self._logger.warning("Notification deadline of %s seconds reached. Ignoring pending requests"
+								 % self._timeout)
+		return batch.results()
+
+	def shutdown(self):
+		self._pool.shutdown()
+
+	def __run_call(self, batch, index, code_block, args):
+		batch.set_result(index, self.__execute(code_block, args))
+
+	def __execute(self, code_block, args):
+		try:
+			return code_block(*args)
+		except Exception as e:
+			self._logger.exception("Error sending notification: %s" % str(e))
+			return None
+
+
+class _WorkerPool:
+	"""
+	Daemon threads that execute tasks in the order they were queued. Threads are started when the first
+	task is queued
+	"""
+
+	def __init__(self, logger, name, max_workers):
+		self._logger = logger
+		self._name = name
+		self._max_workers = max_workers
+		self._queue = queue.Queue()
+		self._workers = []
+		self._lock = threading.Lock()
+
+	def execute(self, task):
+		"""
+		:param task: function without parameters to execute
+		"""
+		self.__start_workers()
+		self._queue.put(task)
+
+	def size(self):
+		return len(self._workers)
+
+	def shutdown(self):
+		""" Stop worker threads once they are done with queued tasks """
+		with self._lock:
+			workers = self._workers
+			self._workers = []
+		for _ in workers:
+			self._queue.put(_STOP)
+
+	def __start_workers(self):
+		if len(self._workers) >= self._max_workers:
+			return
+		with self._lock:
+			while len(self._workers) < self._max_workers:
+				worker = threading.Thread(target=self.__run_worker, name=self._name)
+				worker.daemon = True
+				worker.start()
+				self._workers.append(worker)
+
+	def __run_worker(self):
+		while True:
+			task = self._queue.get()
+			if task is _STOP:
+				# Pool is shutting down
+				return
+			try:
+				task()
+			except Exception as e:
+				self._logger.exception("Error running task of %s: %s" % (self._name, str(e)))
+
+
+class _FanOutBatch:
+
+	def __init__(self, size):
+		self._condition = threading.Condition()
+		self._results = [None] * size
+		self._pending = size
+
+	def set_result(self, index, result):
+		with self._condition:
+			self._results[index] = result
+			self._pending -= 1
+			if self._pending == 0:
+				self._condition.notify_all()
+
+	def wait(self, timeout):
+		""" Returns True if all calls finished before the timeout """
+		deadline = time.time() + timeout
+		with self._condition:
+			while self._pending > 0:
+				remaining = deadline - time.time()
+				if remaining <= 0:
+					return False
+				self._condition.wait(remaining)
+			return True
+
+	def results(self):
+		# Copy so that calls that finish after the deadline do not change returned results
+		with self._condition:
+			return list(self._results)
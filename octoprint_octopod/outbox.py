@@ -0,0 +1,255 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+from . import http_session
+from .json_store import write_atomically
+
+try:
+	from urllib.parse import urlparse  # Python 3
+except ImportError:
+	from urlparse import urlparse  # Python 2
+
+# Seconds to wait before first retry. Wait doubles after each failed retry up to max
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 60 * 60
+# Max number of notifications to keep. Oldest ones are dropped first
+MAX_ENTRIES = 200
+# Seconds that a notification is worth retrying (unless sender specifies otherwise)
+DEFAULT_TTL_SECONDS = 6 * 60 * 60
+# Notifications that are soon replaced by newer ones are not worth retrying for long. Keys are event codes
+# of push notifications and names of IFTTT events
+SHORT_LIVED_TTL_SECONDS = {"Print progress": 10 * 60, "layer_changed": 10 * 60,
+						   "print-progress": 10 * 60, "layer-changed": 10 * 60}
+
+
+def event_ttl(event):
+	""" Returns seconds that a notification of the event (push event code or IFTTT event) is worth retrying """
+	return SHORT_LIVED_TTL_SECONDS.get(event, DEFAULT_TTL_SECONDS)
+
+
+class Outbox:
+	"""
+	Notifications that could not be sent because OctoPod server (or IFTTT) was unreachable or failed.
+	Notifications are kept in a JSONL file in the plugin data folder so they survive a restart and are
+	retried with exponential backoff (with jitter so that many OctoPrint instances do not retry at
+	the same time). Each notification expires after its TTL so low value notifications (e.g. progress
+	or silent notifications) are dropped instead of being delivered late. When a request to a server
+	succeeds, notifications that could not reach that server are sent right away. Notifications that
+	the server failed to process wait for their backoff. Images are not kept, only the JSON of the request
+	"""
+
+	def __init__(self, logger):
+		self._logger = logger
+		self._lock = threading.Lock()
+		self._file_path = None
+		self._entries = []
+		self._url_resolvers = {}  # Target -> function that returns URL of a notification of the target
+		self._timer = None
+		self._timer_due = None
+		self._flushing = False
+
+	def load(self, file_path):
+		"""
+		Load notifications that were pending when OctoPrint stopped and start retrying them
+
+		:param file_path: JSONL file where pending notifications are kept
+		"""
+		entries = []
+		if os.path.exists(file_path):
+			try:
+				with open(file_path, 'r') as infile:
+					for line in infile:
+						line = line.strip()
+						if line:
+							entries.append(json.loads(line))
+			except (IOError, OSError, ValueError) as e:
+				self._logger.warning("Could not load pending notifications: %s" % str(e))
+		with self._lock:
+			self._file_path = file_path
+			# Notifications added before loading were not saved yet
+			self._entries = entries + self._entries
+			self.__save()
+			if self._entries:
+				self.__schedule(0)
+		if entries:
+			self._logger.info("Loaded %s pending notifications" % len(entries))
+
+	def register_target(self, target, url_resolver):
+		"""
+		Register service whose URLs must not be saved to disk (e.g. IFTTT URLs include the key of the user).
+		Notifications of the target keep a reference (e.g. IFTTT event) and the URL is built when sending
+
+		:param target: name of the service
+		:param url_resolver: function that receives the reference and returns the URL to post the
+		notification to or None if notification can no longer be sent
+		"""
+		self._url_resolvers[target] = url_resolver
+
+	def add(self, url, data, ttl, unreachable=False):
+		"""
+		Add notification that failed to be sent
+
+		:param url: URL to post the notification to
+		:param data: JSON data of the notification
+		:param ttl: seconds the notification is still useful. Zero or None means do not retry
+		:param unreachable: True if server could not be reached. False if server failed to process the notification
+		"""
+		self.__add(dict(url=url, endpoint=self.__endpoint(url)), data, ttl, unreachable)
+
+	def add_to_target(self, target, ref, data, ttl, unreachable=False):
+		"""
+		Add notification of a registered target that failed to be sent. URL is not saved
+
+		:param target: name of the service used to register the URL resolver
+		:param ref: reference passed to the URL resolver (e.g. IFTTT event)
+		:param data: JSON data of the notification
+		:param ttl: seconds the notification is still useful. Zero or None means do not retry
+		:param unreachable: True if server could not be reached. False if server failed to process the notification
+		"""
+		self.__add(dict(target=target, ref=ref, endpoint=target), data, ttl, unreachable)
+
+	def on_sent(self, url, target=None):
+		"""
+		A request was successfully sent so the server is reachable again. Send notifications that could
+		not reach the server now. Notifications that the server failed to process keep their backoff
+
+		:param url: URL of the request
+		:param target: Optional. Name of the registered target of the request
+		"""
+		if not self._entries:
+			return
+		endpoint = target or self.__endpoint(url)
+		with self._lock:
+			if self._flushing:
+				# Flush in progress is already sending notifications
+				return
+			now = time.time()
+			reachable = False
+			for entry in self._entries:
+				if entry.get("endpoint") == endpoint and entry.get("unreachable") and entry["next_attempt"] > now:
+					entry["next_attempt"] = now
+					reachable = True
+			if reachable:
+				self.__schedule(0)
+
+	def get_stats(self):
+		with self._lock:
+			return dict(pending=len(self._entries))
+
+	def shutdown(self):
+		with self._lock:
+			if self._timer is not None:
+				self._timer.cancel()
+				self._timer = None
+
+	# Private functions
+
+	def __add(self, entry, data, ttl, unreachable):
+		if not ttl:
+			return
+		now = time.time()
+		entry.update(id=uuid.uuid4().hex, data=data, expires=now + ttl, attempts=0, unreachable=unreachable,
+					 next_attempt=now + self.__backoff(0))
+		with self._lock:
+			self._entries.append(entry)
+			if len(self._entries) > MAX_ENTRIES:
+				self._entries = self._entries[-MAX_ENTRIES:]
+				self.__save()
+			elif self._file_path is not None:
+				self.__append(entry)
+			self.__schedule(entry["next_attempt"] - now)
+		self._logger.debug("Notification added to outbox. Pending: %s" % len(self._entries))
+
+	def __flush(self):
+		with self._lock:
+			self._timer = None
+			self._flushing = True
+			now = time.time()
+			# Drop expired notifications
+			self._entries = [entry for entry in self._entries if entry["expires"] > now]
+			# Only send notifications whose backoff has elapsed
+			pending = sorted([entry for entry in self._entries if entry["next_attempt"] <= now],
+							 key=lambda entry: entry["next_attempt"])
+		sent_ids = set()
+		for entry in pending:
+			if self.__send(entry):
+				sent_ids.add(entry["id"])
+			else:
+				entry["attempts"] += 1
+				entry["next_attempt"] = time.time() + self.__backoff(entry["attempts"])
+		with self._lock:
+			self._flushing = False
+			self._entries = [entry for entry in self._entries if entry["id"] not in sent_ids]
+			self.__save()
+			if self._entries:
+				self.__schedule(min(entry["next_attempt"] for entry in self._entries) - time.time())
+		if sent_ids:
+			self._logger.info("Sent %s pending notifications. Pending: %s" % (len(sent_ids), len(self._entries)))
+
+	def __send(self, entry):
+		url = entry.get("url")
+		if url is None:
+			url_resolver = self._url_resolvers.get(entry.get("target"))
+			url = url_resolver(entry["ref"]) if url_resolver else None
+			if url is None:
+				# e.g. user removed the IFTTT key
+				self._logger.info("Dropped pending notification of %s" % entry.get("target"))
+				return True
+		try:
+			response = http_session.post(url, json=entry["data"])
+			if response.status_code >= 500:
+				entry["unreachable"] = False
+				return False
+			if response.status_code >= 400:
+				# Retrying will not help
+				self._logger.info("Dropped pending notification. Response: %s" % str(response.content))
+			return True
+		except Exception as e:
+			self._logger.debug("Could not send pending notification: %s" % str(e))
+			entry["unreachable"] = True
+			return False
+
+	@staticmethod
+	def __endpoint(url):
+		parsed_url = urlparse(url)
+		return "%s://%s" % (parsed_url.scheme, parsed_url.netloc)
+
+	def __schedule(self, delay):
+		if self._flushing:
+			# Flush in progress will schedule next flush based on pending notifications
+			return
+		due = time.time() + max(delay, 0)
+		if self._timer is not None:
+			if self._timer_due <= due:
+				# Flush is already scheduled before this one
+				return
+			self._timer.cancel()
+		self._timer_due = due
+		self._timer = threading.Timer(max(delay, 0), self.__flush)
+		self._timer.daemon = True
+		self._timer.start()
+
+	@staticmethod
+	def __backoff(attempts):
+		delay = min(RETRY_BASE_SECONDS * (2 ** attempts), RETRY_MAX_SECONDS)
+		# Add jitter so that retries are spread
+		return delay / 2.0 + random.uniform(0, delay / 2.0)
+
+	def __append(self, entry):
+		try:
+			with open(self._file_path, 'a') as outfile:
+				outfile.write(json.dumps(entry) + "\n")
+		except (IOError, OSError) as e:
+			self._logger.warning("Could not save pending notification: %s" % str(e))
+
+	def __save(self):
+		if self._file_path is None:
+			return
+		try:
+			write_atomically(self._file_path, "".join(json.dumps(entry) + "\n" for entry in self._entries))
+		except (IOError, OSError) as e:
+			self._logger.warning("Could not save pending notifications: %s" % str(e))
@@ -3,8 +3,8 @@ from .base_notification import BaseNotification
 
 class Palette2Notifications(BaseNotification):
 
-	def __init__(self, logger, ifttt_alerts, plugin_manager):
-		BaseNotification.__init__(self, logger, plugin_manager)
+	def __init__(self, logger, ifttt_alerts, plugin_manager, dispatcher, alerts):
+		BaseNotification.__init__(self, logger, plugin_manager, dispatcher, alerts)
 		self._ifttt_alerts = ifttt_alerts
 
 	def check_plugin_message(self, settings, printer, plugin, data):
@@ -22,4 +22,4 @@ class Palette2Notifications(BaseNotification):
 		# Send IFTTT Notifications
 		self._ifttt_alerts.fire_event(settings, "palette2-error", error_code)
 		event_param = {'PaletteError': error_code}
-		return self._send_base_notification(settings, False, event_code, event_param=event_param)
+		return self._dispatch(self._send_base_notification, settings, False, event_code, event_param=event_param)
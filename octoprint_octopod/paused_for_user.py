@@ -1,15 +1,17 @@
 import time
 
 from .base_notification import BaseNotification
+from .rate_limiter import rate_limiter
 
 
 class PausedForUser(BaseNotification):
+	# Lines printed by firmware when printer has paused for user
+	RECEIVED_GCODE_PREFIXES = ("echo:busy: paused for user", "// action:paused")
+	EVENT_CODE = "paused-user-event"
 
-	def __init__(self, logger, ifttt_alerts, plugin_manager):
-		BaseNotification.__init__(self, logger, plugin_manager)
+	def __init__(self, logger, ifttt_alerts, plugin_manager, dispatcher, alerts):
+		BaseNotification.__init__(self, logger, plugin_manager, dispatcher, alerts)
 		self._ifttt_alerts = ifttt_alerts
-		self._last_notification = None  # Keep track of when was user alerted last time. Helps avoid spamming
-		self._snooze_end_time = time.time()  # Track when snooze for events ends. Assume snooze already expired
 
 	def process_sent_gcode(self, settings, printer, gcode):
 		# If printing from OctoPrint then check for M600. Some firmwares do not
@@ -28,16 +30,14 @@ class PausedForUser(BaseNotification):
 				# Check if we never alerted or 5 minutes have passed since last alert
 				self.__send_notification_if_needed(settings)
 			else:
-				# If sending gcode then printer is no longer paused. Clear timestamp of last
-				# notification so that new pause notifications can be sent. This helps in
-				# case of 2 consecutive pauses
-				self._last_notification = None
+				# If sending gcode then printer is no longer paused. Allow new pause
+				# notifications to be sent. This helps in case of 2 consecutive pauses
+				rate_limiter.reset(self.EVENT_CODE)
 
 	def process_received_gcode(self, settings, printer, line):
 		# Firmware will print to terminal when printer has paused for user
 
-		# if line.startswith("Not SD printing"):
-		if line.startswith("echo:busy: paused for user") or line.startswith("// action:paused"):
+		if line.startswith(self.RECEIVED_GCODE_PREFIXES):
 			# Check if this type of notification is disabled
 			if not self.__is_notification_enabled(settings):
 				return line
@@ -52,35 +52,27 @@ class PausedForUser(BaseNotification):
 		# Always return what we parsed
 		return line
 
-	def snooze(self, minutes):
-		"""Snooze Pause For User events for the specified number of minutes"""
-		self._snooze_end_time = time.time() + (minutes * 60)
-		self._logger.debug("PausedForUser Notification snoozing until {0}".format(time.ctime(self._snooze_end_time)))
-
 	def __send_notification(self, settings):
 		# Send IFTTT Notifications
 		self._ifttt_alerts.fire_event(settings, "paused-for-user", "")
 
-		return self._send_base_notification(settings, False, "paused-user-event")
+		return self._dispatch(self._send_base_notification, settings, False, self.EVENT_CODE)
 
 	# Private functions
 
 	def __is_notification_enabled(self, settings):
 		"""  Check if this type of notification is disabled """
-		pause_interval = settings.get_int(['pause_interval'])
+		pause_interval = settings.pause_interval
 		return pause_interval != 0
 
 	def __send_notification_if_needed(self, settings):
-		pause_interval = settings.get_int(['pause_interval'])
-		if self._last_notification is None or (time.time() - self._last_notification) / 60 > pause_interval:
+		pause_interval = settings.pause_interval
+		if rate_limiter.allow(self.EVENT_CODE, pause_interval * 60):
 			self._logger.info("*** Printer paused for user ***")
-			# Record last time we sent notification
-			self._last_notification = time.time()
-			# Send APNS Notification only if interval is not zero (user requested to
-			# shutdown this notification) and there is no active snooze for this type of events
-			if time.time() > self._snooze_end_time:
+			# Send APNS Notification only if there is no active snooze for this type of events
+			if not rate_limiter.is_snoozed(self.EVENT_CODE):
 				self.__send_notification(settings)
 			else:
 				self._logger.debug("PausedForUser Notification skipped. Snoozing until {0}"
-								   .format(time.ctime(self._snooze_end_time)))
+								   .format(time.ctime(rate_limiter.snooze_end_time(self.EVENT_CODE))))
 
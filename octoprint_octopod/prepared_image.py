@@ -0,0 +1,108 @@
+import binascii
+import os
+
+
+class PreparedImage:
+	"""
+	Image to include in push notifications. The multipart part that holds the image is serialized
+	once and then shared (never copied) by the requests sent to each recipient. Only the small JSON
+	part is created for each request so memory and CPU do not depend on number of devices
+	"""
+
+	def __init__(self, image):
+		"""
+		:param image: JPEG bytes, bytes-like object (e.g. bytearray) or file-like object with the JPEG
+		"""
+		if hasattr(image, "read"):
+			# File-like image (e.g. passed to the apns_notification helper)
+			image = image.read()
+		if not isinstance(image, bytes):
+			image = bytes(image)
+		self._boundary = binascii.hexlify(os.urandom(16))
+		self.content_type = "multipart/form-data; boundary=" + self._boundary.decode("ascii")
+		# Image is the last part of the body so closing boundary is also immutable
+		self._image_part = b"".join([
+			b"--", self._boundary, b"\r\n",
+			b'Content-Disposition: form-data; name="image"; filename="image.jpg"\r\n',
+			b"Content-Type: image/jpeg\r\n\r\n",
+			image, b"\r\n",
+			b"--", self._boundary, b"--\r\n"
+		])
+
+	def multipart_body(self, json_data):
+		"""
+		Returns body to send in the HTTP request. Body is a file-like object that streams
+		the JSON part followed by the shared image part
+
+		:param json_data: JSON string to include in the 'json' part
+		:return: file-like object with known length
+		"""
+		json_part = b"".join([
+			b"--", self._boundary, b"\r\n",
+			b'Content-Disposition: form-data; name="json"\r\n',
+			b"Content-Type: application/json\r\n\r\n",
+			json_data.encode("utf-8"), b"\r\n"
+		])
+		return _MultipartBody([json_part, self._image_part])
+
+
+class _MultipartBody:
+	"""
+	Read-only file-like object over the parts of a multipart body. Iterable, with seek and tell, so
+	that requests treats it as a stream and can rewind the body when the request is sent again
+	(e.g. redirects)
+	"""
+
+	# Bytes returned by each step of the iteration
+	_CHUNK_SIZE = 64 * 1024
+
+	def __init__(self, parts):
+		self._parts = [memoryview(part) for part in parts]
+		self._length = sum(len(part) for part in parts)
+		self._part = 0
+		self._offset = 0
+
+	def __len__(self):
+		return self._length
+
+	def __iter__(self):
+		while True:
+			chunk = self.read(self._CHUNK_SIZE)
+			if not chunk:
+				return
+			yield chunk
+
+	def tell(self):
+		return sum(len(part) for part in self._parts[:self._part]) + self._offset
+
+	def seek(self, offset, whence=os.SEEK_SET):
+		if whence == os.SEEK_CUR:
+			offset += self.tell()
+		elif whence == os.SEEK_END:
+			offset += self._length
+		elif whence != os.SEEK_SET:
+			raise ValueError("Invalid whence (%r)" % whence)
+		if offset < 0:
+			raise ValueError("Negative seek position %d" % offset)
+		# Find part that holds the position
+		self._part = 0
+		self._offset = min(offset, self._length)
+		while self._part < len(self._parts) and self._offset >= len(self._parts[self._part]):
+			self._offset -= len(self._parts[self._part])
+			self._part += 1
+		return self.tell()
+
+	def read(self, size=-1):
+		if size is None or size < 0:
+			size = self._length
+		chunks = []
+		while size > 0 and self._part < len(self._parts):
+			part = self._parts[self._part]
+			chunk = part[self._offset:self._offset + size]
+			chunks.append(chunk.tobytes())
+			size -= len(chunk)
+			self._offset += len(chunk)
+			if self._offset >= len(part):
+				self._part += 1
+				self._offset = 0
+		return b"".join(chunks)
@@ -0,0 +1,72 @@
+import threading
+import time
+
+
+class RateLimiter:
+	"""
+	Control how often notifications are sent to avoid spamming the user. Each key (usually the event
+	code of the notification) has a token bucket that holds up to 'burst' tokens and gets a new token
+	every 'interval' seconds. Users can also snooze an event code for some minutes. All checks are
+	dictionary lookups so they are cheap enough for detectors that process every line from the printer
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._buckets = {}  # key -> [available tokens, time of last refill]
+		self._snoozes = {}  # event code -> time when snooze ends
+
+	def allow(self, key, interval, burst=1, start_empty=False):
+		"""
+		Consume a token of the bucket of the key if there is one available
+
+		:param key: identifies the bucket (e.g. event code of the notification)
+		:param interval: seconds to get a new token. Zero means no limit
+		:param burst: max number of tokens that the bucket can hold
+		:param start_empty: True if nothing is allowed until a notification is recorded for the key
+		:return: True if notification can be sent
+		"""
+		if interval <= 0:
+			return True
+		now = time.time()
+		with self._lock:
+			bucket = self._buckets.get(key)
+			if bucket is None:
+				if start_empty:
+					return False
+				# Bucket starts full
+				self._buckets[key] = [burst - 1, now]
+				return True
+			tokens = min(burst, bucket[0] + (now - bucket[1]) / float(interval))
+			bucket[1] = now
+			if tokens >= 1:
+				bucket[0] = tokens - 1
+				return True
+			bucket[0] = tokens
+			return False
+
+	def record(self, key):
+		""" A notification for the key was sent without asking. Empty its bucket """
+		with self._lock:
+			self._buckets[key] = [0, time.time()]
+
+	def reset(self, key):
+		""" Refill the bucket of the key so next notification is allowed """
+		with self._lock:
+			self._buckets.pop(key, None)
+
+	def snooze(self, event_code, minutes):
+		""" Do not send notifications of the event code for the specified number of minutes """
+		with self._lock:
+			self._snoozes[event_code] = time.time() + minutes * 60
+
+	def is_snoozed(self, event_code):
+		end_time = self._snoozes.get(event_code)
+		return end_time is not None and time.time() < end_time
+
+	def snooze_end_time(self, event_code):
+		""" Returns time when snooze of the event code ends or None if event code was never snoozed """
+		return self._snoozes.get(event_code)
+
+
+# Rate limiter shared by all notifications
+rate_limiter = RateLimiter()
@@ -0,0 +1,50 @@
+import threading
+from array import array
+
+
+class SampleRingBuffer:
+	"""
+	Fixed capacity history of (time, value) samples. Samples are stored in two preallocated arrays
+	(columns) so adding a sample overwrites the oldest one in O(1) and no objects are created.
+	Each sample gets a sequence number that clients can use as a cursor to only read new samples
+	"""
+
+	def __init__(self, capacity):
+		self._capacity = int(capacity)
+		self._lock = threading.Lock()
+		self._times = array('d', [0]) * self._capacity
+		self._values = array('d', [0]) * self._capacity
+		self._next = 0  # Sequence number of next sample. Also number of samples added so far
+
+	def __len__(self):
+		return min(self._next, self._capacity)
+
+	def append(self, sample_time, value):
+		with self._lock:
+			index = self._next % self._capacity
+			self._times[index] = sample_time
+			self._values[index] = value
+			self._next += 1
+
+	def samples(self, since=None, step=1):
+		"""
+		Returns samples added after the specified cursor
+
+		:param since: Optional. Cursor returned by a previous call. All samples are returned if not specified
+		or if samples after the cursor are no longer in the buffer
+		:param step: Optional. Only return 1 of every 'step' samples. Newest sample is always included
+		:return: tuple with list of times, list of values and cursor to use to read the next samples
+		"""
+		with self._lock:
+			end = self._next
+			start = max(end - self._capacity, 0)
+			if since is not None and since > start:
+				start = min(since, end)
+			step = max(int(step), 1)
+			# Walk back from newest sample so that newest sample is included when downsampling
+			sequences = range(end - 1, start - 1, -step)
+			times = [self._times[sequence % self._capacity] for sequence in sequences]
+			values = [self._values[sequence % self._capacity] for sequence in sequences]
+		times.reverse()
+		values.reverse()
+		return times, values, end
@@ -0,0 +1,68 @@
+import copy
+
+
+class SettingsSnapshot(object):
+	"""
+	Immutable copy of the plugin settings. Reading OctoPrint settings walks the settings tree on
+	each call so hot paths (e.g. lines received from the printer or temperature checks) read plain
+	attributes of this snapshot instead. Plugin creates a new snapshot whenever settings are saved.
+
+	Snapshot also offers get, get_int and get_boolean so it can be used where plugin settings are
+	expected by notifications that are not in hot paths
+	"""
+
+	__slots__ = ("_values", "tokens", "temp_interval", "pause_interval", "mmu_interval", "bed_low",
+				 "bed_target_temp_hold", "bed_warm_notify_once", "tool0_low", "tool0_target_temp", "chamber_low",
+				 "chamber_target_temp", "soc_temp_high",
+				 "thermal_runway_threshold", "thermal_threshold_minutes_frequency",
+				 "thermal_cooldown_seconds_threshold", "thermal_below_target_threshold",
+				 "thermal_warmup_bed_seconds_threshold", "thermal_warmup_hotend_seconds_threshold",
+				 "thermal_warmup_chamber_seconds_threshold")
+
+	def __init__(self, settings, keys, tokens=None):
+		"""
+		:param settings: Plugin settings
+		:param keys: keys of the plugin settings to copy
+		:param tokens: Optional. Registered tokens to use instead of the ones in settings
+		"""
+		values = dict((key, copy.deepcopy(settings.get([key]))) for key in keys)
+		if tokens is not None:
+			values["tokens"] = tokens
+		if values.get("tokens") is None:
+			# Safety check in case a user manually modified config.yaml and left invalid JSON
+			values["tokens"] = []
+		self.__set("_values", values)
+		self.__set("tokens", values["tokens"])
+		for key in SettingsSnapshot.__slots__[2:]:
+			if key in ("bed_warm_notify_once", "tool0_target_temp", "chamber_target_temp"):
+				self.__set(key, settings.get_boolean([key]))
+			else:
+				self.__set(key, settings.get_int([key]))
+
+	def get(self, path):
+		return self._values.get(path[0])
+
+	def get_int(self, path):
+		value = self.get(path)
+		if value is None:
+			return None
+		try:
+			return int(value)
+		except ValueError:
+			return None
+
+	def get_boolean(self, path):
+		value = self.get(path)
+		if value is None:
+			return None
+		if isinstance(value, bool):
+			return value
+		if isinstance(value, (int, float)):
+			return value != 0
+		return str(value).lower() in ("true", "yes", "y", "1", "on")
+
+	def __setattr__(self, key, value):
+		raise AttributeError("Settings snapshot cannot be modified")
+
+	def __set(self, key, value):
+		object.__setattr__(self, key, value)
@@ -0,0 +1,219 @@
+import struct
+import threading
+import time
+from io import BytesIO  ## for Python 2 & 3
+
+from PIL import Image, ImageStat
+
+# Max resolution of images to send. Bigger images produce 400 errors when uploading content.
+# Besides this saves network bandwidth and iOS device or Apple Watch cannot tell the difference
+MAX_SIZE = (1640, 1232)
+# Luminance below threshold is considered a dark image. Use same value used in iOS app
+DARK_IMAGE_THRESHOLD = 40
+# Resolution is enough to calculate average luminance of the image
+LUMINANCE_SIZE = (160, 120)
+# EXIF orientation that displays image as if it was flipped horizontally, flipped vertically and
+# then rotated 90 degrees counterclockwise. Key is (hflip, vflip, rotate). See ImageOps.exif_transpose
+EXIF_ORIENTATIONS = {
+	(False, False, False): 1,
+	(True, False, False): 2,
+	(True, True, False): 3,
+	(False, True, False): 4,
+	(True, False, True): 5,
+	(True, True, True): 6,
+	(False, True, True): 7,
+	(False, False, True): 8
+}
+_EXIF_ORIENTATION_TAG = 0x0112
+
+
+class SnapshotCache:
+	"""
+	Cache of processed webcam snapshots. Notifications fired at the same time (e.g. layer changed
+	and print progress) share a single request to the webcam. Concurrent requests for the same key
+	wait for the request in progress (single-flight) and the image is reused until it expires
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._images = {}  # key -> (expiration time, image)
+		self._in_flight = {}  # key -> _Flight of the snapshot being taken
+
+	def get(self, key, ttl, loader):
+		"""
+		Returns cached image for the key or load it
+
+		:param key: identifies the image (e.g. snapshot URL and transform settings)
+		:param ttl: seconds to keep the loaded image. Zero means only share requests in progress
+		:param loader: function to call to take the snapshot
+		:return: image returned by loader
+		"""
+		with self._lock:
+			cached = self._images.get(key)
+			if cached is not None and cached[0] > time.time():
+				return cached[1]
+			flight = self._in_flight.get(key)
+			owner = flight is None
+			if owner:
+				flight = _Flight()
+				self._in_flight[key] = flight
+
+		if not owner:
+			# Wait for the request in progress
+			flight.done.wait()
+			if flight.error is not None:
+				raise flight.error
+			return flight.image
+
+		try:
+			flight.image = loader()
+		except Exception as e:
+			flight.error = e
+			raise
+		finally:
+			with self._lock:
+				del self._in_flight[key]
+				now = time.time()
+				# Remove expired images
+				for expired in [k for k, cached in self._images.items() if cached[0] <= now]:
+					del self._images[expired]
+				if flight.error is None and ttl and ttl > 0:
+					self._images[key] = (now + ttl, flight.image)
+			flight.done.set()
+		return flight.image
+
+
+class _Flight:
+
+	def __init__(self):
+		self.done = threading.Event()
+		self.image = None
+		self.error = None
+
+
+# Cache shared by all notifications
+snapshot_cache = SnapshotCache()
+
+
+def open_image(image):
+	"""
+	Returns PIL image for the specified JPEG bytes. Pixels are not decoded until they are needed
+	"""
+	return Image.open(BytesIO(image))
+
+
+def image_luminance(image):
+	"""
+	Returns average perceived luminance (0-255) of the image. JPEG images are decoded in grayscale and
+	at a reduced resolution (DCT scaling) so this takes milliseconds and constant memory. Grayscale
+	conversion uses the same perceived luminance formula: L = R * 0.299 + G * 0.587 + B * 0.114
+
+	:param image: JPEG bytes of the webcam snapshot
+	:return: average luminance
+	"""
+	image_obj = open_image(image)
+	image_obj.draft("L", LUMINANCE_SIZE)
+	if image_obj.mode != "L":
+		# Image was not a JPEG or has a mode (e.g. CMYK) that cannot be decoded straight to grayscale
+		image_obj = image_obj.convert("L")
+	return ImageStat.Stat(image_obj).mean[0]
+
+
+def transform_image(image, hflip, vflip, rotate):
+	"""
+	Reduce resolution of the image (if needed) and transpose it according to the webcam settings.
+	Image is decoded once, all transformations are applied to the same in-memory image and the
+	result is encoded once. Original bytes are returned untouched if there is nothing to do and
+	only the EXIF Orientation tag is set if the image does not need to be resized
+
+	:param image: JPEG bytes of the webcam snapshot
+	:param hflip: True if image should be flipped horizontally
+	:param vflip: True if image should be flipped vertically
+	:param rotate: True if image should be rotated 90 degrees
+	:return: JPEG bytes
+	"""
+	image_obj = open_image(image)
+	x, y = image_obj.size
+	resize = x > MAX_SIZE[0] or y > MAX_SIZE[1]
+	if not resize and not hflip and not vflip and not rotate:
+		return image
+	if not resize:
+		# Only orientation needs to change. Set EXIF Orientation tag (honored by the app) so pixels are
+		# not decoded nor encoded again. Quality is not lost and this takes no time
+		oriented_image = set_exif_orientation(image, EXIF_ORIENTATIONS[(bool(hflip), bool(vflip), bool(rotate))])
+		if oriented_image is not None:
+			return oriented_image
+
+	if resize:
+		# Let JPEG decoder scale down the image (DCT scaling by 1/2, 1/4 or 1/8) to the smallest size that
+		# is still bigger than final size. Decoding is faster and uses less memory. Then resample to max size
+		ratio = min(float(MAX_SIZE[0]) / x, float(MAX_SIZE[1]) / y)
+		image_obj.draft(image_obj.mode, (int(x * ratio), int(y * ratio)))
+		# ANTIALIAS was removed in Pillow 10.0.0 so check which variation we can use
+		image_obj.thumbnail(MAX_SIZE, Image.ANTIALIAS if hasattr(Image, "ANTIALIAS") else Image.Resampling.LANCZOS)
+	# https://www.blog.pythonlibrary.org/2017/10/05/how-to-rotate-mirror-photos-with-python/
+	if hflip:
+		image_obj = image_obj.transpose(Image.FLIP_LEFT_RIGHT)
+	if vflip:
+		image_obj = image_obj.transpose(Image.FLIP_TOP_BOTTOM)
+	if rotate:
+		# Transpose (instead of rotate) so that image is not cropped when it is not a square
+		image_obj = image_obj.transpose(Image.ROTATE_90)
+
+	# https://stackoverflow.com/questions/646286/python-pil-how-to-write-png-image-to-string/5504072
+	output = BytesIO()
+	image_obj.save(output, format="JPEG")
+	image = output.getvalue()
+	output.close()
+	return image
+
+
+def set_exif_orientation(image, orientation):
+	"""
+	Set EXIF Orientation tag of a JPEG image without decoding it. An existing Orientation
+	tag is updated in place or a new EXIF segment is added if image has no EXIF information
+
+	:param image: JPEG bytes
+	:param orientation: EXIF orientation (1-8)
+	:return: JPEG bytes or None if image is not a JPEG or its EXIF information has no Orientation tag
+	"""
+	if image[:2] != b"\xff\xd8":
+		return None
+	insert_at = 2
+	offset = 2
+	while offset + 4 <= len(image):
+		marker, length = struct.unpack(">HH", image[offset:offset + 4])
+		if marker < 0xffe0 or marker > 0xffef:
+			# No more APPn segments
+			break
+		if marker == 0xffe1 and image[offset + 4:offset + 10] == b"Exif\x00\x00":
+			return _update_exif_orientation(image, offset + 10, orientation)
+		if marker == 0xffe0 and offset == 2:
+			# Keep JFIF segment as first segment of the image
+			insert_at = offset + 2 + length
+		offset += 2 + length
+
+	tiff = b"".join([
+		b"MM\x00\x2a", struct.pack(">I", 8),
+		# IFD0 with only the Orientation tag (type SHORT with 1 value) and no next IFD
+		struct.pack(">H", 1), struct.pack(">HHIHH", _EXIF_ORIENTATION_TAG, 3, 1, orientation, 0), struct.pack(">I", 0)
+	])
+	segment = b"\xff\xe1" + struct.pack(">H", len(tiff) + 8) + b"Exif\x00\x00" + tiff
+	return image[:insert_at] + segment + image[insert_at:]
+
+
+def _update_exif_orientation(image, tiff_start, orientation):
+	try:
+		byte_order = ">" if image[tiff_start:tiff_start + 2] == b"MM" else "<"
+		ifd_offset = tiff_start + struct.unpack(byte_order + "I", image[tiff_start + 4:tiff_start + 8])[0]
+		entries = struct.unpack(byte_order + "H", image[ifd_offset:ifd_offset + 2])[0]
+		for i in range(entries):
+			entry = ifd_offset + 2 + i * 12
+			tag, tag_type = struct.unpack(byte_order + "HH", image[entry:entry + 4])
+			if tag == _EXIF_ORIENTATION_TAG and tag_type == 3:
+				value = entry + 8
+				return image[:value] + struct.pack(byte_order + "H", orientation) + image[value + 2:]
+	except struct.error:
+		# Invalid EXIF information
+		pass
+	return None
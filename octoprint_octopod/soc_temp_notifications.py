@@ -1,29 +1,41 @@
 import time
 
 from .base_notification import BaseNotification
+from .rate_limiter import rate_limiter
+from .ring_buffer import SampleRingBuffer
 
 
 class SocTempNotifications(BaseNotification):
+	EVENT_CODE = "soc_temp_exceeded"
 
-	def __init__(self, logger, ifttt_alerts, plugin_manager, interval, debugMode):
-		BaseNotification.__init__(self, logger, plugin_manager)
+	def __init__(self, logger, ifttt_alerts, plugin_manager, dispatcher, alerts, interval, debugMode):
+		BaseNotification.__init__(self, logger, plugin_manager, dispatcher, alerts)
 		self._ifttt_alerts = ifttt_alerts
 		self._checks_per_minute = 60 / interval # number of times a check will be done per minute
 		self.sbc = None
 		self.send_plugin_message = None
 
-		self._checks_between_alerts = self._checks_per_minute if debugMode else self._checks_per_minute * 60 * 2 # Alert every 2 hours
-		self._checks_since_alert = -1 # -1 means an alert was not sent in the last 2 hours
+		self._seconds_between_alerts = 60 if debugMode else 60 * 60 * 2 # Alert every 2 hours
 
-		self._recorded_temps = []
-		self._record_max_count = self._checks_per_minute * 60 # Track 1 hour of temperatures
+		self._recorded_temps = SampleRingBuffer(self._checks_per_minute * 60) # Track 1 hour of temperatures
 
-	def get_soc_temps(self):
-		""" Returns list of recorded SoC temperatures """
-		return self._recorded_temps
+	def get_soc_temps(self, since=None, step=None):
+		"""
+		Returns recorded SoC temperatures. If no cursor nor step is specified then returns a list of
+		dict(time, temp) for older clients. Otherwise returns temperatures recorded after the cursor
+		in columns: dict(time=[...], temp=[...], cursor=N). Use returned cursor in the next call
+
+		:param since: Optional. Cursor returned by a previous call
+		:param step: Optional. Only return 1 of every 'step' temperatures
+		"""
+		times, temps, cursor = self._recorded_temps.samples(since, step or 1)
+		times = [int(sample_time) for sample_time in times]
+		if since is None and step is None:
+			return [dict(time=sample_time, temp=temp) for sample_time, temp in zip(times, temps)]
+		return dict(time=times, temp=temps, cursor=cursor)
 
 	def check_soc_temp(self, settings):
-		soc_temp_threshold = settings.get_int(['soc_temp_high'])
+		soc_temp_threshold = settings.soc_temp_high
 		if soc_temp_threshold == 0:
 			# Do nothing if user requested to disable this check
 			return
@@ -33,28 +45,17 @@ class SocTempNotifications(BaseNotification):
 
 		# Update recorded SoC temps
 		int_time = int(time.time())
-		self._recorded_temps.append(dict(time= int_time, temp= temp))
-		if len(self._recorded_temps) >= self._record_max_count:
-			# remove oldest recorded temp to keep array within limits
-			self._recorded_temps.pop(0)
+		self._recorded_temps.append(int_time, temp)
 		# Send websockets data with updated recorded temp
 		self.send_plugin_message(dict(time= int_time, temp= temp))
 
-		# Check if we need to send an alert due to high temp
-		if self._checks_since_alert > -1:
-			# An alert has been sent so count that we did a check
-			self._checks_since_alert = self._checks_since_alert + 1
-			# If number of checks has gone above time to be silent then reset counter
-			if self._checks_since_alert > self._checks_between_alerts:
-				self._checks_since_alert = -1
-		if temp > soc_temp_threshold:
-			# If an alert was not sent in the last 2 hours
-			if self._checks_since_alert == -1:
-				self.__send__soc_temp_notification(settings, soc_temp_threshold, temp)
-				self._checks_since_alert = 0 # Start counting alerts since we sent this alert
+		# Check if we need to send an alert due to high temp. Only if an alert was not sent in the last 2 hours
+		if temp > soc_temp_threshold and rate_limiter.allow(self.EVENT_CODE, self._seconds_between_alerts):
+			self.__send__soc_temp_notification(settings, soc_temp_threshold, temp)
 
 	def __send__soc_temp_notification(self, settings, soc_temp_threshold, soc_current_temp):
 		# Send IFTTT Notifications
 		self._ifttt_alerts.fire_event(settings, "soc-temp-exceeded", soc_temp_threshold)
 		event_param = {'SoCThreshold': soc_temp_threshold, 'SoCTemp': soc_current_temp}
-		return self._send_base_notification(settings, False, "soc_temp_exceeded", event_param=event_param)
+		return self._dispatch(self._send_base_notification, settings, False, self.EVENT_CODE,
+							  event_param=event_param)
@@ -3,8 +3,8 @@ from .base_notification import BaseNotification
 
 class SpoolManagerNotifications(BaseNotification):
 
-	def __init__(self, logger, ifttt_alerts, plugin_manager):
-		BaseNotification.__init__(self, logger, plugin_manager)
+	def __init__(self, logger, ifttt_alerts, plugin_manager, dispatcher, alerts):
+		BaseNotification.__init__(self, logger, plugin_manager, dispatcher, alerts)
 		self._ifttt_alerts = ifttt_alerts
 
 	def check_plugin_message(self, settings, printer, plugin, data):
@@ -21,4 +21,4 @@ class SpoolManagerNotifications(BaseNotification):
 	def __send_spool_manager_notification(self, settings, message):
 		# Send IFTTT Notifications
 		self._ifttt_alerts.fire_event(settings, "spool_manager-not-enough-filament", "")
-		return self._send_arbitrary_notification(settings, message, None)
+		return self._dispatch(self._send_arbitrary_notification, settings, message, None)
@@ -0,0 +1,71 @@
+# Temperature reports sent by the firmware. Autoreport (M155) lines start with the temperature while
+# M105 responses start with 'ok'. Examples:
+#   'T:210.0 /210.0 B:60.0 /60.0 T0:210.0 /210.0 T1:25.0 /0.0 @:127 B@:0'
+#   'ok T:210.0 /210.0 B:60.0 /60.0 @:127 B@:0'
+#   'ok B:60.0 /60.0 T0:210.0 /210.0'
+RECEIVED_GCODE_PREFIXES = ("T:", " T:", "ok T:", "T0:", "ok T0:", "B:", "ok B:")
+
+# Heaters identified by a single letter. Tools (e.g. T0, T1) are handled separately
+_HEATERS = {'B': 'bed', 'C': 'chamber'}
+
+
+def parse_temperature_line(line):
+	"""
+	Parse temperatures of a line reported by the firmware. Lines are parsed with plain string
+	operations (no regular expressions) since printers that autoreport temperatures send these
+	lines many times per second. Heaters that do not report a target temperature are ignored
+
+	:param line: line received from the printer
+	:return: dictionary like the one of printer.get_current_temperatures() or None if no temperature
+	was found. Example: {'tool0': {'actual': 210.0, 'target': 210.0}, 'bed': {'actual': 60.0, 'target': 60.0}}
+	"""
+	temps = None
+	current_tool = None  # Temperature of 'T:' (current tool). Only used if no 'Tn:' was reported
+	tokens = line.split()
+	count = len(tokens)
+	i = 0
+	while i < count:
+		token = tokens[i]
+		i += 1
+		separator = token.find(':')
+		if separator <= 0:
+			# Not a temperature (e.g. 'ok')
+			continue
+		key = token[:separator]
+		if key == 'T':
+			heater = None
+		elif key[0] == 'T' and key[1:].isdigit():
+			heater = 'tool' + key[1:]
+		else:
+			heater = _HEATERS.get(key)
+			if heater is None:
+				# Not a heater (e.g. '@:' or 'B@:' heater power)
+				continue
+		value = token[separator + 1:]
+		slash = value.find('/')
+		if slash >= 0:
+			# Target is part of same token (e.g. 'T:210.0/210.0')
+			actual = value[:slash]
+			target = value[slash + 1:]
+		elif i < count and tokens[i][0] == '/':
+			actual = value
+			target = tokens[i][1:]
+			i += 1
+		else:
+			continue
+		try:
+			temperature = {'actual': float(actual), 'target': float(target)}
+		except ValueError:
+			continue
+		if heater is None:
+			current_tool = temperature
+			continue
+		if temps is None:
+			temps = {}
+		temps[heater] = temperature
+	if current_tool is not None and (temps is None or 'tool0' not in temps):
+		# Single extruder printers only report 'T:'
+		if temps is None:
+			temps = {}
+		temps['tool0'] = current_tool
+	return temps
@@ -0,0 +1,128 @@
+import threading
+import time
+
+from octoprint.printer import PrinterCallback
+
+# Seconds during which temperatures reported by OctoPrint are ignored after processing a line parsed
+# by the plugin. OctoPrint reports the same line right after the plugin parsed it
+PARSED_LINE_SECONDS = 1
+
+
+class HeaterSample:
+	""" Temperature of a heater (e.g. bed, tool0 or chamber) at some point in time """
+
+	__slots__ = ("heater", "actual", "target", "time")
+
+	def __init__(self, heater, actual, target, sample_time):
+		self.heater = heater
+		self.actual = actual
+		self.target = target
+		self.time = sample_time
+
+
+class TemperaturePipeline:
+	"""
+	Pass temperatures of the printer to all registered detectors (e.g. bed, tools and thermal
+	protection notifications). Temperatures are pushed by OctoPrint as soon as the firmware reports
+	them (see TemperatureCallback) and are only fetched by the fallback timer (see tick) when no
+	report was received recently. Temperatures are converted once into a HeaterSample per heater.
+	Detectors that are disabled by the user are skipped and if all of them are disabled then
+	temperatures are not even fetched
+	"""
+
+	def __init__(self, logger):
+		self._logger = logger
+		self._detectors = []
+		self._lock = threading.Lock()  # Detectors process one sample at a time
+		self._last_process_time = 0  # Time when last temperatures were processed
+		self._last_parsed_time = 0  # Time when last temperatures parsed by the plugin were processed
+
+	def register(self, detector):
+		"""
+		Register detector to receive temperatures
+
+		:param detector: object with is_enabled(settings) and check_temps(settings, printer, samples)
+		"""
+		self._detectors.append(detector)
+
+	def tick(self, settings, printer, max_age):
+		"""
+		Fetch current temperatures of the printer and pass them to enabled detectors. Nothing
+		is done if temperatures were processed in the last max_age seconds
+
+		:param max_age: seconds since last processed temperatures before polling the printer
+		"""
+		if time.time() - self._last_process_time < max_age:
+			# Printer is reporting temperatures so there is no need to poll
+			return
+		detectors = [detector for detector in self._detectors if detector.is_enabled(settings)]
+		if not detectors:
+			return
+		self.__process(settings, printer, detectors, printer.get_current_temperatures(), time.time())
+
+	def process(self, settings, printer, temps, sample_time=None):
+		"""
+		Pass temperatures to enabled detectors
+
+		:param temps: temperatures as reported by OctoPrint. Example:
+		{
+			'bed': {'actual': 0.9, 'target': 0.0, 'offset': 0},
+			'tool0': {'actual': 0.0, 'target': 0.0, 'offset': 0}
+		}
+		:param sample_time: Optional. Time when temperatures were reported
+		"""
+		if time.time() - self._last_parsed_time < PARSED_LINE_SECONDS:
+			# Temperatures were already processed when the line was received (see process_parsed)
+			return
+		detectors = [detector for detector in self._detectors if detector.is_enabled(settings)]
+		if detectors:
+			self.__process(settings, printer, detectors, temps, sample_time or time.time())
+
+	def process_parsed(self, settings, printer, temps):
+		"""
+		Pass temperatures parsed from a line received from the printer to enabled detectors.
+		Temperatures reported by OctoPrint for the same line will be ignored
+
+		:param temps: temperatures as returned by parse_temperature_line
+		"""
+		detectors = [detector for detector in self._detectors if detector.is_enabled(settings)]
+		if detectors:
+			now = time.time()
+			self._last_parsed_time = now
+			self.__process(settings, printer, detectors, temps, now)
+
+	def __process(self, settings, printer, detectors, temps, sample_time):
+		if not temps:
+			return
+		self._last_process_time = time.time()
+		samples = {}
+		for heater, values in temps.items():
+			if isinstance(values, dict):
+				samples[heater] = HeaterSample(heater, values.get('actual'), values.get('target'), sample_time)
+		with self._lock:
+			for detector in detectors:
+				try:
+					detector.check_temps(settings, printer, samples)
+				except Exception as e:
+					self._logger.exception("Error checking temperatures: %s" % str(e))
+
+
+class TemperatureCallback(PrinterCallback):
+	"""
+	Printer callback that passes temperatures to the pipeline as soon as OctoPrint receives them
+	from the printer (autoreport or OctoPrint polling with M105)
+	"""
+
+	def __init__(self, pipeline, settings_provider, printer):
+		"""
+		:param pipeline: TemperaturePipeline that will process reported temperatures
+		:param settings_provider: function that returns current settings snapshot
+		:param printer: printer object that holds printer information
+		"""
+		self._pipeline = pipeline
+		self._settings_provider = settings_provider
+		self._printer = printer
+
+	def on_printer_add_temperature(self, data):
+		# Example of data: {'time': 1600000000, 'tool0': {'actual': 21.3, 'target': 0.0}, 'bed': {...}}
+		self._pipeline.process(self._settings_provider(), self._printer, data, data.get('time'))
@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+
+from .json_store import DebouncedSave, write_atomically
+
+HEATING = 1
+COOLING = -1
+# Weight of the rate of the last cycle when updating the learned rate of a heater
+LEARNING_WEIGHT = 0.3
+# Number of cycles to observe before trusting the learned rate of a heater
+MIN_CYCLES = 3
+# Heaters go slower as they get closer to their max temp so rates are learned for each target temp
+# rounded to this number of degrees
+TARGET_STEP = 10
+
+
+class ThermalProfiles:
+	"""
+	Heating and cooling rates learned for each heater (e.g. bed, tool0 or chamber). Every bed and hotend
+	heats at its own rate so the rate of each completed heating (or cooling) cycle is observed and
+	averaged with previous cycles of the same target temperature. Heaters slow down as they get closer
+	to target temperature so rates are relative to the distance to target temperature (degrees per
+	second for each degree of distance). Profiles are kept in a small JSON file in the plugin data
+	folder so they survive restarts. Changes are saved after a delay from a background thread so
+	detectors never wait for the disk
+	"""
+
+	def __init__(self, logger, flush_delay=5):
+		"""
+		:param logger: Plugin logger
+		:param flush_delay: seconds to wait for more changes before saving profiles
+		"""
+		self._logger = logger
+		self._lock = threading.Lock()
+		self._debounced_save = DebouncedSave(self.__save, flush_delay)
+		self._file_path = None
+		self._profiles = {}  # Heater -> {'heating': {'210': {'relative_rate': 1/s, 'cycles': N}}, 'cooling': {...}}
+
+	def load(self, file_path):
+		"""
+		Load learned profiles
+
+		:param file_path: JSON file where profiles are kept
+		"""
+		profiles = {}
+		if os.path.exists(file_path):
+			try:
+				with open(file_path, 'r') as infile:
+					profiles = json.load(infile)
+			except (IOError, OSError, ValueError) as e:
+				self._logger.warning("Could not load thermal profiles: %s" % str(e))
+		with self._lock:
+			self._file_path = file_path
+			self._profiles = profiles if isinstance(profiles, dict) else {}
+
+	def observe(self, heater, direction, target, rate):
+		"""
+		Learn from a heating or cooling cycle that reached target temperature
+
+		:param heater: name of the heater (e.g. bed)
+		:param direction: HEATING or COOLING
+		:param target: target temperature of the cycle
+		:param rate: slowest rate relative to the distance to target temperature measured during the cycle
+		"""
+		if rate <= 0:
+			return
+		key = self.__target_key(target)
+		with self._lock:
+			profile = self._profiles.setdefault(heater, {}).setdefault(self.__direction_key(direction), {})
+			learned = profile.get(key)
+			if learned and 'relative_rate' in learned:
+				rate = learned['relative_rate'] + LEARNING_WEIGHT * (rate - learned['relative_rate'])
+				cycles = learned['cycles'] + 1
+			else:
+				cycles = 1
+			# Replace (never modify) learned rate so readers do not need the lock
+			profile[key] = {'relative_rate': rate, 'cycles': cycles}
+		self._debounced_save.changed()
+
+	def expected_rate(self, heater, direction, target):
+		"""
+		Returns learned rate (relative to the distance to target temperature) of the heater when going to
+		the target temperature or None if not enough cycles were observed
+		"""
+		learned = self._profiles.get(heater, {}).get(self.__direction_key(direction), {}).get(self.__target_key(target))
+		# Profiles saved before rates were relative are ignored
+		if learned and 'relative_rate' in learned and learned['cycles'] >= MIN_CYCLES:
+			return learned['relative_rate']
+		return None
+
+	def flush(self):
+		""" Save pending changes now """
+		self._debounced_save.flush()
+
+	# Private functions
+
+	def __direction_key(self, direction):
+		return 'heating' if direction == HEATING else 'cooling'
+
+	def __target_key(self, target):
+		# JSON keys are strings
+		return str(int(round(target / float(TARGET_STEP))) * TARGET_STEP)
+
+	def __save(self):
+		with self._lock:
+			if self._file_path is None:
+				return
+			file_path = self._file_path
+			text = json.dumps(self._profiles)
+		try:
+			write_atomically(file_path, text)
+		except (IOError, OSError) as e:
+			self._logger.warning("Could not save thermal profiles: %s" % str(e))
@@ -1,207 +1,178 @@
-import time
-
 from .base_notification import BaseNotification
+from .heater_window import HeaterWindow
+from .rate_limiter import rate_limiter
+from .thermal_profiles import COOLING, HEATING
+
+
+# Max number of samples kept for each heater
+WINDOW_CAPACITY = 64
+# Rate (degrees per second) in the wrong direction needed to alert before the window covers the
+# whole warmup/cooldown period
+EARLY_MIN_RATE = 0.02
+# Seconds to wait before alerting when temp is clearly going in the wrong direction
+MIN_TREND_SECONDS = 5
+# Number of standard errors of the measured rate that are attributed to noisy readings. Alerting before
+# the window covers the whole warmup/cooldown period requires more certainty
+NOISE_FACTOR = 1
+EARLY_NOISE_FACTOR = 3
+# Seconds of samples needed to check heaters with a learned profile against their learned rate
+LEARNED_SPAN_SECONDS = 10
+# Fraction of the learned rate (relative to the distance to target temp) that heaters must keep
+ENVELOPE_FACTOR = 0.4
 
 
 class ThermalProtectionNotifications(BaseNotification):
+	# Line printed by firmware when heater timed out while printer was paused for user
+	RECEIVED_GCODE_PREFIXES = ("echo:Press button to heat nozzle",)
+	EVENT_CODE = "thermal-runaway"
 
-	def __init__(self, logger, ifttt_alerts, plugin_manager):
-		BaseNotification.__init__(self, logger, plugin_manager)
+	def __init__(self, logger, ifttt_alerts, plugin_manager, dispatcher, alerts, thermal_profiles):
+		BaseNotification.__init__(self, logger, plugin_manager, dispatcher, alerts)
 		self._ifttt_alerts = ifttt_alerts
-		self._last_thermal_runaway_notification_time = None  # Variable used for spacing notifications
-		self._last_actual_temps = {} # Variable that helps know if we are cooling down or not
-		self._last_target_temps = {} # Variable that helps know if we need to reset saved info
+		self._thermal_profiles = thermal_profiles
+		self._windows = {}  # Heater -> HeaterWindow with recent temps to know if temps go in the right direction
 		self._heater_timeout = False
 
-	def check_temps(self, settings, printer):
-		temps = printer.get_current_temperatures()
-		# self._logger.debug(u"CheckTemps(): %r" % (temps,))
-		if not temps:
-			# self._logger.debug(u"No Temperature Data")
-			return
+	def is_enabled(self, settings):
+		""" Returns True if user wants to receive thermal runaway notifications """
+		return settings.thermal_runway_threshold > 0
 
-		# example dictionary from octoprint
-		# {
-		#   'bed': {'actual': 0.9, 'target': 0.0, 'offset': 0},
-		#   'tool0': {'actual': 0.0, 'target': 0.0, 'offset': 0},
-		#   'tool1': {'actual': 0.0, 'target': 0.0, 'offset': 0}
-		# }
-		thermal_threshold = settings.get_int(['thermal_runway_threshold'])
+	def check_temps(self, settings, printer, samples):
+		"""
+		Check for possible thermal runaway of each heater
 
-		if thermal_threshold > 0:
-			# Check for possible thermal runaway
-			for k in temps.keys():
-				self.__check_thermal_runway(temps, k, thermal_threshold, settings)
+		:param settings: Plugin settings
+		:param printer: printer object that holds printer information
+		:param samples: HeaterSample of each heater of the printer
+		"""
+		thermal_threshold = settings.thermal_runway_threshold
+		for sample in samples.values():
+			self.__check_thermal_runway(sample, thermal_threshold, settings)
 
 	def process_received_gcode(self, line):
 		# Firmware will print to terminal when printer has paused for user. If user does not respond
 		# quickly then heater will timeout and will start to cool down while keeping hotend target temp
 		# unmodified. We need to detect this case to not send incorrect thermal runaway alerts.
 		# '//action:' messages are i18n'ed so cannot be used to detect heater timeout
-		if line.startswith("echo:Press button to heat nozzle"):
+		if line.startswith(self.RECEIVED_GCODE_PREFIXES):
 			self._logger.debug("Thermal runaway - Printer paused for user and heater timed out")
 			self._heater_timeout = True
 
-	def __check_thermal_runway(self, temps, part, thermal_threshold, settings):
-		thermal_threshold_minutes_frequency = settings.get_int(['thermal_threshold_minutes_frequency'])
-		target_temp = temps[part]['target']
-		if target_temp and target_temp > 0:
-			# Check if target temp has changed
-			if target_temp != self.__get_last_target_temp(part):
-				# Target temp changed so store it, reset old stored info and continue
-				self.__save_last_target_temp(part, target_temp)
-				self.__clear_last_actual_temp(part)
-			# Proceed with thermal checking
-			actual_temp = temps[part]['actual']
-			now = time.time()
-			cooldown_threshold = settings.get_int(['thermal_cooldown_seconds_threshold'])
-			# Check if there is a possible thermal runaway when we are heating up more than we requested (very unusual)
-			if actual_temp >= (target_temp + thermal_threshold):
-				# Ignore if we are cooling down (could happen when target temp went down and actual is still higher)
-				if not self.__get_last_actual_temp(part) or self.__get_last_actual_temp(part) > actual_temp:
-					if not self.__get_last_actual_temp(part):
-						self._logger.debug("Thermal runaway - Started to track {0}. Temp should go down. "
-										  "Actual {1} and Target {2} ".format(part, actual_temp, target_temp))
-					else:
-						self._logger.debug("Thermal runaway - Tracking {0}. Temp going down. "
-										  "Actual {1} and Target {2} ".format(part, actual_temp, target_temp))
-					# Remember last temp so we can see if we are still cooling down
-					self.__save_last_temp(part, actual_temp)
-					return
-				elif self.__get_last_actual_temp(part) == actual_temp:
-					# Not cooling down yet and temp still the same. Give it up to 14 seconds to cool
-					# down or send the alert
-					if self.__get_last_actual_temp_time(part) + cooldown_threshold > now:
-						self._logger.debug("Thermal runaway - Tracking {0}. Temp NOT going down. Will wait more time. "
-										  "Actual {1} and Target {2} ".format(part, actual_temp, target_temp))
-						# We can still wait more time to let things cool down
-						return
-				elif self.__temp_increased_upto(actual_temp, self.__get_last_actual_temp(part), 9) and \
-							self.__get_last_actual_temp_time(part) + cooldown_threshold > now:
-					self._logger.debug("Thermal runaway - Tracking {0}. Temp went UP instead of DOWN. Will wait "
-									   "more time. Actual {1} and Target {2} ".format(part, actual_temp, target_temp))
-					# We can still wait more time to let things cool down
-					return
-
-				# Alert about possible thermal runaway (unless we just alerted)
-				self.__thermal_runaway_detected(actual_temp, now, part, settings, target_temp,
-											  thermal_threshold_minutes_frequency)
-			else:
-				# Check if we are below target and not warming up (more realistic case). Some firmwares
-				# already perform this check but some printers still have thermal runaway disabled so this
-				# check can save those printers from catching fire
-				below_target_threshold = settings.get_int(['thermal_below_target_threshold'])
-				warmup_threshold = self.__get_warmup_threshold(settings, part)
-				# Check if below target temp. Use range to say that it is below target
-				if actual_temp + below_target_threshold < target_temp:
-					if not self.__get_last_actual_temp(part):
-						self._logger.debug("Thermal runaway - Started to track {0}. Temp should go up. "
-										  "Actual {1} and Target {2} ".format(part, actual_temp, target_temp))
-						# Remember last temp so we can see if we temps are going up or not
-						self.__save_last_temp(part, actual_temp)
-						return
-					# Check if temp is going down since heater timed out when printer paused waiting for user
-					if self._heater_timeout and actual_temp <= self.__get_last_actual_temp(part) + 1:
-						# Heater timed out when printer paused waiting for user and temp is still going down
-						# Added 1C in case temp goes down to room temp and has minor fluctuations
-						self._logger.debug("Thermal runaway - Ignore checking since heater timed out waiting for user. "
-										  "Actual {1} and Target {2} ".format(part, actual_temp, target_temp))
-						# Remember last temp so we can see if we temps are going up or not
-						self.__save_last_temp(part, actual_temp)
-						return
-					# Check if current temp is still the same as last time we checked (or up to 2C lower)
-					# Allow up to 1C lower since sometimes bed may lose half a degree
-					if (actual_temp == self.__get_last_actual_temp(part) or
-						self.__temp_decreased_upto(actual_temp, self.__get_last_actual_temp(part), 2)) and \
-							self.__get_last_actual_temp_time(part) + warmup_threshold > now:
-						self._logger.debug("Thermal runaway - Tracking {0}. Temp NOT going up. Will wait more time. "
-										  "Actual {1} and Target {2} ".format(part, actual_temp, target_temp))
-						# We can still wait more time to let things warm up
-						return
-					# Check if temp did not increase since last temp check. Task runs every 5 seconds
-					# so if temp did not increase in 5 seconds then send alert
-					if actual_temp <= self.__get_last_actual_temp(part):
-						# Alert about possible thermal runaway (unless we just alerted)
-						self.__thermal_runaway_detected(actual_temp, now, part, settings, target_temp,
-														thermal_threshold_minutes_frequency)
-					else:
-						self._logger.debug("Thermal runaway - Tracking {0}. Temp going up. "
-										  "Actual {1} and Target {2} ".format(part, actual_temp, target_temp))
-						# Clear up flag that tracks if heater timed out. Marlin does not print a
-						# unique code to know when user pressed button to heat nozzle after
-						# printer paused for user and heater timed out. So if we see temp go up
-						# then we can assume user pressed button. Not ideal solution in case there
-						# is a thermal runaway exactly at this time. But best we can do atm
-						self._heater_timeout = False
-						# Remember last temp so we can see if we temp keeps going up
-						self.__save_last_temp(part, actual_temp)
-				else:
-					# Temp is not above target range and is not below target range. IOW, it is in an ok range
-					self._logger.debug("Thermal runaway - Temp of {0} is within range. "
-									  "Actual {1} and Target {2} ".format(part, actual_temp, target_temp))
-					self.__clear_last_actual_temp(part)
-		else:
+	def __check_thermal_runway(self, sample, thermal_threshold, settings):
+		part = sample.heater
+		target_temp = sample.target
+		if not target_temp or target_temp <= 0:
 			# No target temp is defined so clean up any tracking info
-			self.__clear_last_actual_temp(part)
-			self.__clear_last_target_temp(part)
-
-	def __thermal_runaway_detected(self, actual_temp, now, part, settings, target_temp,
-								 thermal_threshold_minutes_frequency):
-		last_time = self._last_thermal_runaway_notification_time
-		should_alert = not last_time or now > last_time + (thermal_threshold_minutes_frequency * 60)
-		if should_alert:
+			self._windows.pop(part, None)
+			return
+		window = self._windows.get(part)
+		if window is None or window.target != target_temp:
+			# Target temp changed so reset old stored info and continue
+			window = HeaterWindow(WINDOW_CAPACITY, target_temp)
+			self._windows[part] = window
+
+		actual_temp = sample.actual
+		if actual_temp >= (target_temp + thermal_threshold):
+			# Heating up more than we requested (very unusual). Temp should go down
+			direction = COOLING
+			span = settings.thermal_cooldown_seconds_threshold
+		elif actual_temp + settings.thermal_below_target_threshold < target_temp:
+			# Below target and not warming up (more realistic case). Some firmwares already perform this
+			# check but some printers still have thermal runaway disabled so this check can save those
+			# printers from catching fire
+			direction = HEATING
+			span = self.__get_warmup_threshold(settings, part)
+		else:
+			# Temp is not above target range and is not below target range. IOW, it is in an ok range
+			if window.direction:
+				self._logger.debug("Thermal runaway - Temp of {0} is within range. "
+								   "Actual {1} and Target {2} ".format(part, actual_temp, target_temp))
+				if window.slowest_rate is not None:
+					# Heater reached target temp so learn how fast it went
+					self._thermal_profiles.observe(part, window.direction, target_temp, window.slowest_rate)
+				window.clear()
+				window.direction = 0
+			return
+
+		if window.direction != direction:
+			self._logger.debug("Thermal runaway - Started to track {0}. Temp should go {1}. Actual {2} and Target {3} ".
+							   format(part, "up" if direction > 0 else "down", actual_temp, target_temp))
+			window.clear()
+			window.direction = direction
+		window.add(sample.time, actual_temp, span)
+		duration = window.duration()
+		if duration < MIN_TREND_SECONDS:
+			return
+		fit = window.rate()
+		if fit is None:
+			return
+		rate, noise = fit
+		if direction > 0 and self._heater_timeout and rate - NOISE_FACTOR * noise > 0:
+			# Clear up flag that tracks if heater timed out. Marlin does not print a
+			# unique code to know when user pressed button to heat nozzle after
+			# printer paused for user and heater timed out. So if we see temp go up
+			# then we can assume user pressed button. Not ideal solution in case there
+			# is a thermal runaway exactly at this time. But best we can do atm
+			self._heater_timeout = False
+
+		# Rate (degrees per second) towards target temp
+		rate_towards_target = rate * direction
+		# Heater with a learned profile is checked against its own rate instead of waiting
+		# the whole warmup/cooldown period
+		expected_rate = self._thermal_profiles.expected_rate(part, direction, target_temp)
+		if duration < span and (expected_rate is None or duration < LEARNED_SPAN_SECONDS):
+			if rate_towards_target + EARLY_NOISE_FACTOR * noise > -EARLY_MIN_RATE:
+				# Temp is not clearly going in the wrong direction so we can still wait
+				# more time to let temp go in the right direction
+				return
+		else:
+			# Heaters slow down as they get closer to target temp so rates are relative to the
+			# distance between temps of the window and target temp
+			distance = (target_temp - window.mean_temp()) * direction
+			# Temp is not going towards target temp. Give it the benefit of the noise of the readings
+			stalled = duration >= span and rate_towards_target + NOISE_FACTOR * noise <= 0
+			# Temp is going towards target temp much slower than it used to. Learned rates are only
+			# estimates so this requires more certainty
+			too_slow = expected_rate is not None and distance > 0 and \
+				rate_towards_target + EARLY_NOISE_FACTOR * noise < ENVELOPE_FACTOR * expected_rate * distance
+			if not stalled and not too_slow:
+				# Temp is going in the right direction
+				if duration >= span and distance > 0 and rate_towards_target - EARLY_NOISE_FACTOR * noise > 0:
+					relative_rate = rate_towards_target / distance
+					if window.slowest_rate is None or relative_rate < window.slowest_rate:
+						window.slowest_rate = relative_rate
+				return
+
+		if direction > 0 and self._heater_timeout:
+			# Heater timed out when printer paused waiting for user and temp is not going up
+			self._logger.debug("Thermal runaway - Ignore checking since heater timed out waiting for user. "
+							   "Actual {0} and Target {1} ".format(actual_temp, target_temp))
+			return
+
+		self._logger.debug("Thermal runaway - {0} should go {1} but is changing at {2:.3f} C/s (noise {3:.3f}) over "
+						   "{4:.0f} seconds".format(part, "up" if direction > 0 else "down", rate, noise, duration))
+		# Alert about possible thermal runaway (unless we just alerted)
+		self.__thermal_runaway_detected(actual_temp, part, settings, target_temp,
+										settings.thermal_threshold_minutes_frequency)
+
+	def __thermal_runaway_detected(self, actual_temp, part, settings, target_temp, thermal_threshold_minutes_frequency):
+		# Space notifications to avoid spamming the user
+		if rate_limiter.allow(self.EVENT_CODE, thermal_threshold_minutes_frequency * 60):
 			self._logger.warning("Possible thermal runaway detected for {0}. Actual {1} and Target {2} ".
 							   format(part, actual_temp, target_temp))
-			self.__send__thermal_notification(settings, "thermal-runaway")
-			self._last_thermal_runaway_notification_time = now
-			self.__clear_last_actual_temp(part)
+			self.__send__thermal_notification(settings, self.EVENT_CODE)
+			self._windows[part].clear()
 
 	def __send__thermal_notification(self, settings, event_code):
 		# Fire IFTTT webhook
 		self._ifttt_alerts.fire_event(settings, event_code, "")
 		# Send push notification via OctoPod app
-		self._send_base_notification(settings, False, event_code)
-
-	def __temp_decreased_upto(self, actual_temp, last_actual_temp, decrease):
-		return last_actual_temp > actual_temp > last_actual_temp - decrease
-
-	def __temp_increased_upto(self, actual_temp, last_actual_temp, increase):
-		return last_actual_temp < actual_temp < last_actual_temp + increase
-
-	def __save_last_temp(self, part, actual_temp):
-		self._last_actual_temps[part] = (actual_temp, time.time())
-
-	def __clear_last_actual_temp(self, part):
-		# Use pop and use some default value in case key does not exist
-		self._last_actual_temps.pop(part, 0)
-
-	def __get_last_actual_temp(self, part):
-		tuple = self._last_actual_temps.get(part)
-		return tuple[0] if tuple else None
-
-	def __get_last_actual_temp_time(self, part):
-		tuple = self._last_actual_temps.get(part)
-		return tuple[1] if tuple else None
-
-	def __save_last_target_temp(self, part, target_temp):
-		self._last_target_temps[part] = (target_temp, time.time())
-
-	def __clear_last_target_temp(self, part):
-		# Use pop and use some default value in case key does not exist
-		self._last_target_temps.pop(part, 0)
-
-	def __get_last_target_temp(self, part):
-		tuple = self._last_target_temps.get(part)
-		return tuple[0] if tuple else None
-
-	def __get_last_target_temp_time(self, part):
-		tuple = self._last_target_temps.get(part)
-		return tuple[1] if tuple else None
+		self._dispatch(self._send_base_notification, settings, False, event_code)
 
 	def __get_warmup_threshold(self, settings, part):
 		if part == 'bed':
-			return settings.get_int(['thermal_warmup_bed_seconds_threshold'])
+			return settings.thermal_warmup_bed_seconds_threshold
 		elif part.startswith('tool'):
-			return settings.get_int(['thermal_warmup_hotend_seconds_threshold'])
+			return settings.thermal_warmup_hotend_seconds_threshold
 		else:
-			return settings.get_int(['thermal_warmup_chamber_seconds_threshold'])
+			return settings.thermal_warmup_chamber_seconds_threshold
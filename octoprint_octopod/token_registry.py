@@ -0,0 +1,118 @@
+import bisect
+import datetime
+import threading
+
+from .json_store import DebouncedSave
+
+
+class TokenRegistry:
+	"""
+	Tokens registered by OctoPod app. Tokens are indexed by (apnsToken, printerID) and by apnsToken
+	so registering a token does not scan all tokens. Changes are saved to settings after a delay so
+	that many devices registering at the same time (e.g. after an app update) produce a single write
+	of config.yaml. Token dicts are never modified, a new dict replaces the old one, so lists returned
+	by this class are safe to use while tokens are being updated
+	"""
+
+	def __init__(self, logger, save_callback, flush_delay=5):
+		"""
+		:param logger: Plugin logger
+		:param save_callback: function that receives list of tokens to save
+		:param flush_delay: seconds to wait for more changes before saving tokens
+		"""
+		self._logger = logger
+		self._save_callback = save_callback
+		self._lock = threading.Lock()
+		self._debounced_save = DebouncedSave(self.__save, flush_delay)
+		self._tokens = []
+		self._by_key = {}  # (apnsToken, printerID) -> position of token
+		self._by_apns_token = {}  # apnsToken -> sorted positions of tokens (one per printer)
+
+	def load(self, tokens):
+		""" Replace registered tokens with tokens read from settings """
+		with self._lock:
+			self._tokens = [dict(token) for token in tokens or []]
+			self.__reindex()
+
+	def unique_tokens(self):
+		"""
+		Returns registered tokens without duplicates. The same OctoPrint instance may be added
+		twice on the iOS app (usually one for local address and one for public address) so
+		only the first token of each APNS token is returned
+		"""
+		with self._lock:
+			return [token for index, token in enumerate(self._tokens)
+					if self._by_apns_token[token["apnsToken"]][0] == index]
+
+	def update(self, old_token, new_token, device_name, printer_id, printer_name, language_code):
+		"""
+		Add or update token reported by OctoPod app
+
+		:return: True if tokens were changed
+		"""
+		now = datetime.datetime.now().strftime("%x %X")
+		with self._lock:
+			index = self._by_key.get((old_token, printer_id))
+			if index is None:
+				index = self._by_key.get((new_token, printer_id))
+			if index is None:
+				self._logger.debug("Adding token for %s." % device_name)
+				# Token was not found so we need to add it
+				self._tokens.append(
+					{'apnsToken': new_token, 'deviceName': device_name, 'date': now, 'printerID': printer_id,
+					 'printerName': printer_name, 'languageCode': language_code})
+				self.__index(len(self._tokens) - 1)
+			else:
+				token = self._tokens[index]
+				changes = {}
+				if token["apnsToken"] == old_token and old_token != new_token:
+					self._logger.debug("Updating token for %s." % device_name)
+					# Token that exists needs to be updated with new token
+					changes["apnsToken"] = new_token
+				if printer_name is not None and token.get("printerName") != printer_name:
+					# Printer name in OctoPod has been updated
+					changes["printerName"] = printer_name
+				if language_code is not None and token.get("languageCode") != language_code:
+					# Language being used by OctoPod has been updated
+					changes["languageCode"] = language_code
+				if not changes:
+					return False
+				changes["date"] = now
+				updated_token = dict(token)
+				updated_token.update(changes)
+				self.__unindex(index)
+				self._tokens[index] = updated_token
+				self.__index(index)
+		self._debounced_save.changed()
+		return True
+
+	def flush(self):
+		""" Save pending changes now """
+		self._debounced_save.flush()
+
+	def __save(self):
+		with self._lock:
+			tokens = list(self._tokens)
+		self._save_callback(tokens)
+		self._logger.debug("Tokens saved")
+
+	def __reindex(self):
+		self._by_key = {}
+		self._by_apns_token = {}
+		for index in range(len(self._tokens)):
+			self.__index(index)
+
+	def __index(self, index):
+		token = self._tokens[index]
+		self._by_key.setdefault((token["apnsToken"], token["printerID"]), index)
+		bisect.insort(self._by_apns_token.setdefault(token["apnsToken"], []), index)
+
+	def __unindex(self, index):
+		token = self._tokens[index]
+		key = (token["apnsToken"], token["printerID"])
+		if self._by_key.get(key) == index:
+			del self._by_key[key]
+		positions = self._by_apns_token[token["apnsToken"]]
+		positions.remove(index)
+		if not positions:
+			del self._by_apns_token[token["apnsToken"]]
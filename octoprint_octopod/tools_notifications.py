@@ -1,69 +1,113 @@
 from .base_notification import BaseNotification
 
 
+class HeaterState:
+	""" Notification state of an extruder (e.g. tool0 or tool1) or of the chamber """
+
+	__slots__ = ("heater", "is_chamber", "was_printing_above_low", "alerted_reached_target")
+
+	def __init__(self, heater, is_chamber):
+		self.heater = heater
+		self.is_chamber = is_chamber  # Chamber has its own thresholds. Extruders use thresholds of tool0
+		self.was_printing_above_low = False  # Variable used for cooling alerts
+		self.alerted_reached_target = False  # Variable used for warm alerts
+
+
 class ToolsNotifications(BaseNotification):
 
-	def __init__(self, logger, ifttt_alerts, plugin_manager):
-		BaseNotification.__init__(self, logger, plugin_manager)
+	def __init__(self, logger, ifttt_alerts, plugin_manager, dispatcher, alerts):
+		BaseNotification.__init__(self, logger, plugin_manager, dispatcher, alerts)
 		self._ifttt_alerts = ifttt_alerts
-		self._printer_was_printing_above_tool0_low = False  # Variable used for tool0 cooling alerts
-		self._printer_alerted_reached_tool0_target = False  # Variable used for tool0 warm alerts
-
-	def check_temps(self, settings, printer):
-		temps = printer.get_current_temperatures()
-		# self._logger.debug(u"CheckTemps(): %r" % (temps,))
-		if not temps:
-			# self._logger.debug(u"No Temperature Data")
-			return
-
-		for k in temps.keys():
-			# example dictionary from octoprint
-			# {
-			#   'bed': {'actual': 0.9, 'target': 0.0, 'offset': 0},
-			#   'tool0': {'actual': 0.0, 'target': 0.0, 'offset': 0},
-			#   'tool1': {'actual': 0.0, 'target': 0.0, 'offset': 0}
-			# }
-			if k == 'tool0':
-				tool0_threshold_low = settings.get_int(['tool0_low'])
-				target_temp = settings.get(['tool0_target_temp'])
-			else:
-				continue
+		self._heaters = {}  # Heater -> HeaterState or None if heater is not an extruder or chamber (e.g. bed)
+		self._multiple_extruders = False  # Messages include name of the extruder when printer has many
 
-			# Check if tool0 has cooled down to specified temperature once print is finished
-			# Remember if we are printing and current tool0 temp is above the low tool0 threshold
-			if not self._printer_was_printing_above_tool0_low and printer.is_printing() and tool0_threshold_low and \
-				temps[k]['actual'] > tool0_threshold_low:
-				self._printer_was_printing_above_tool0_low = True
-
-			# If we are not printing and we were printing before with tool0 temp above threshold and tool0 temp is now
-			# below threshold
-			if self._printer_was_printing_above_tool0_low and not printer.is_printing() and tool0_threshold_low \
-				and temps[k]['actual'] < tool0_threshold_low:
-				self._logger.debug(
-					"Print done and tool0 temp is now below threshold {0}. Actual {1}.".format(tool0_threshold_low,
-																							 temps[k]['actual']))
-				self._printer_was_printing_above_tool0_low = False
-
-				self.__send__tool_notification(settings, "tool0-cooled", tool0_threshold_low)
-
-			# Check if tool0 has reached target temp and user wants to receive alerts for this event
-			if temps[k]['target'] > 0 and target_temp:
-				diff = temps[k]['actual'] - temps[k]['target']
-				# If we have not alerted user and printer reached target temp then alert user. Only alert
-				# when actual is equal to target or passed target by 5. Useful if hotend is too hot after
-				# print and you want to be alerted when it cooled down to a target temp
-				if not self._printer_alerted_reached_tool0_target and 0 <= diff < 5:
-					self._printer_alerted_reached_tool0_target = True
-					self.__send__tool_notification(settings, "tool0-warmed", temps[k]['target'])
-			elif temps[k]['target'] == 0:
-				# There is no target temp so reset alert flag so we can alert again
-				# once a target temp is set
-				self._printer_alerted_reached_tool0_target = False
+	def is_enabled(self, settings):
+		""" Returns True if user wants to receive any extruder or chamber notification """
+		return bool(settings.tool0_low or settings.tool0_target_temp or settings.chamber_low or
+					settings.chamber_target_temp)
+
+	def check_temps(self, settings, printer, samples):
+		"""
+		Check temperature of each extruder and of the chamber of the current sample
+
+		:param settings: Plugin settings
+		:param printer: printer object that holds printer information
+		:param samples: HeaterSample of each heater of the printer
+		"""
+		is_printing = printer.is_printing()
+		for heater, sample in samples.items():
+			if sample.actual is None:
+				# Heater did not report its temperature
+				continue
+			state = self._heaters.get(heater)
+			if state is None:
+				if heater in self._heaters:
+					# Not an extruder or chamber
+					continue
+				state = self.__new_state(heater)
+				self._heaters[heater] = state
+				if state is None:
+					continue
+			if state.is_chamber:
+				self.__check_heater(settings, is_printing, state, sample, settings.chamber_low,
+									settings.chamber_target_temp)
+			else:
+				self.__check_heater(settings, is_printing, state, sample, settings.tool0_low,
+									settings.tool0_target_temp)
 
 	##~~ Private functions - Tool Notifications
 
-	def __send__tool_notification(self, settings, event_code, temperature_threshold):
-		# Send IFTTT Notifications
-		self._ifttt_alerts.fire_event(settings, event_code, temperature_threshold)
-		event_param = {'Tool0Threshold': temperature_threshold}
-		return self._send_base_notification(settings, False, event_code, event_param=event_param)
+	def __new_state(self, heater):
+		if heater == 'chamber':
+			return HeaterState(heater, True)
+		if heater.startswith('tool'):
+			if heater != 'tool0':
+				self._multiple_extruders = True
+			return HeaterState(heater, False)
+		return None
+
+	def __check_heater(self, settings, is_printing, state, sample, threshold_low, target_temp):
+		# Check if heater has cooled down to specified temperature once print is finished
+		# Remember if we are printing and current heater temp is above the low threshold
+		if not state.was_printing_above_low and is_printing and threshold_low and sample.actual > threshold_low:
+			state.was_printing_above_low = True
+
+		# If we are not printing and we were printing before with heater temp above threshold and heater temp is now
+		# below threshold
+		if state.was_printing_above_low and not is_printing and threshold_low and sample.actual < threshold_low:
+			self._logger.debug(
+				"Print done and {0} temp is now below threshold {1}. Actual {2}.".format(state.heater, threshold_low,
+																						 sample.actual))
+			state.was_printing_above_low = False
+
+			self.__send__tool_notification(settings, state, "cooled", threshold_low)
+
+		# Check if heater has reached target temp and user wants to receive alerts for this event
+		# Sensors without a heater (e.g. passive chamber) do not report a target temp
+		if sample.target is not None and sample.target > 0 and target_temp:
+			diff = sample.actual - sample.target
+			# If we have not alerted user and printer reached target temp then alert user. Only alert
+			# when actual is equal to target or passed target by 5. Useful if hotend is too hot after
+			# print and you want to be alerted when it cooled down to a target temp
+			if not state.alerted_reached_target and 0 <= diff < 5:
+				state.alerted_reached_target = True
+				self.__send__tool_notification(settings, state, "warmed", sample.target)
+		elif not sample.target:
+			# There is no target temp so reset alert flag so we can alert again
+			# once a target temp is set
+			state.alerted_reached_target = False
+
+	def __send__tool_notification(self, settings, state, event, temperature_threshold):
+		# Send IFTTT Notifications (e.g. octopod-tool1-cooled)
+		self._ifttt_alerts.fire_event(settings, state.heater + "-" + event, temperature_threshold)
+		if state.is_chamber:
+			event_code = "chamber-" + event
+			event_param = {'ChamberThreshold': temperature_threshold}
+		elif self._multiple_extruders:
+			# All extruders use thresholds of tool0 so message says which extruder it was (e.g. T1)
+			event_code = "tool-" + event
+			event_param = {'ToolName': "T" + state.heater[len('tool'):], 'ToolThreshold': temperature_threshold}
+		else:
+			event_code = "tool0-" + event
+			event_param = {'Tool0Threshold': temperature_threshold}
+		return self._dispatch(self._send_base_notification, settings, False, event_code, event_param=event_param)